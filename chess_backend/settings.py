@@ -14,6 +14,17 @@ else:
     TOKEN_EXP = 2678400  # 1 month
     AUTH_EXP = 3600  # 1 hour
 
+# verified tokens and authenticated players are cached in process
+AUTH_CACHE_SIZE = 10000
+AUTH_PLAYER_CACHE_TTL = 60
+
+# hero model set ids are cached in process, changes in admin clear the cache
+# of the process they are made in, other processes reload ids after ttl
+HERO_MODEL_CACHE_TTL = 300
+
+# generate first deck of new players in celery worker instead of signup request
+FIRST_DECK_ASYNC = False
+
 ALLOWED_HOSTS = []
 
 if DEBUG:
@@ -72,6 +83,61 @@ CHANNEL_LAYERS = {
     },
 }
 
+# storage for players awaiting opponent, use
+# room.services.queue_backend.MemoryQueueBackend for single process setups
+# (it is not shared with celery, so room.tasks.match_queue won't see it)
+ROOM_QUEUE_BACKEND = {
+    "BACKEND": "room.services.queue_backend.RedisQueueBackend",
+    "OPTIONS": {
+        "url": "redis://127.0.0.1:6379/1",
+        "prefix": "queue",
+    },
+}
+
+# moves are journaled and saved to db in batches of ROOM_FLUSH_MOVES
+# or every ROOM_FLUSH_INTERVAL seconds, use
+# room.services.move_journal.MemoryMoveJournal for tests
+ROOM_MOVE_JOURNAL = {
+    "BACKEND": "room.services.move_journal.RedisMoveJournal",
+    "OPTIONS": {
+        "url": "redis://127.0.0.1:6379/1",
+        "prefix": "journal",
+    },
+}
+ROOM_FLUSH_MOVES = 20
+ROOM_FLUSH_INTERVAL = 5
+# room is served by one process at a time, it holds room's lease in journal
+# and renews it every ROOM_FLUSH_INTERVAL, so it must be longer than that
+ROOM_OWNER_TTL = 30
+
+# rooms' players are cached in process for reconnects
+ROOM_SNAPSHOT_CACHE_SIZE = 10000
+ROOM_SNAPSHOT_CACHE_TTL = 600
+# player reconnected within this window resumes session without db reads
+ROOM_SESSION_TTL = 120
+
+# players connected to rooms, use
+# room.services.presence.MemoryPresenceBackend for single process setups,
+# player goes offline if no heartbeat came for ttl seconds,
+# opponent is notified about changes of presence once in ROOM_PRESENCE_NOTIFY_DELAY
+ROOM_PRESENCE_BACKEND = {
+    "BACKEND": "room.services.presence.RedisPresenceBackend",
+    "OPTIONS": {
+        "url": "redis://127.0.0.1:6379/1",
+        "prefix": "presence",
+        "ttl": 30,
+    },
+}
+ROOM_PRESENCE_HEARTBEAT = 10
+ROOM_PRESENCE_NOTIFY_DELAY = 1
+
+# spectator is disconnected when it hasn't acknowledged this many moves
+# or falls this many messages behind the room in process
+ROOM_SPECTATOR_BUFFER = 64
+
+# log board after every move to room.services.game_logic logger
+ROOM_BOARD_TRACE = False
+
 
 WSGI_APPLICATION = "chess_backend.wsgi.application"
 
@@ -115,6 +181,9 @@ LOGGING = {
             "class": "logging.FileHandler",
             "filename": "debug.log",
         },
+        "console": {
+            "class": "logging.StreamHandler",
+        },
     },
     "loggers": {
         "django": {
@@ -122,6 +191,11 @@ LOGGING = {
             "level": "DEBUG",
             "propagate": True,
         },
+        # board trace, written only with ROOM_BOARD_TRACE
+        "room.services.game_logic": {
+            "handlers": ["console"],
+            "level": "DEBUG",
+        },
     },
 }
 
@@ -130,3 +204,9 @@ CELERY_TIMEZONE = "Europe/Moscow"
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
+CELERY_BEAT_SCHEDULE = {
+    "match-queue": {
+        "task": "room.tasks.match_queue",
+        "schedule": 2.0,
+    },
+}
@@ -1,7 +1,23 @@
 from common.generators import gen_ton
 from game.models import Player, Deck, Hero
+from room.services.board import Board
 from room.services.room_create import sync_create_room
 
+try:
+    from termcolor import colored
+except ImportError:  # termcolor is only installed with dev requirements
+
+    def colored(text, *args, **kwargs):
+        return text
+
+
+PIECE_SYMBOLS = {
+    "KING": ("♔", "♚"),
+    "WIZARD": ("♕", "♛"),
+    "ARCHER": ("♗", "♝"),
+    "WARRIOR": ("♙", "♟"),
+}
+
 
 def _check_players_score(players):
     for player in players:
@@ -46,3 +62,20 @@ def generate_room():
     print(f"Authorization: {p1.get_access_token()}")
     print(f"Authorization: {p2.get_access_token()}")
     return None
+
+
+def render_board(board: Board) -> str:
+    """draws board snapshot, first player's heroes are green, second's are red"""
+    rows = []
+    for y in range(1, 9):
+        row = ""
+        for x in range(1, 9):
+            piece = board.get(x, y)
+            if not piece:
+                row += "*"
+            elif piece.first:
+                row += colored(PIECE_SYMBOLS[piece.type][0], "green", attrs=["bold"])
+            else:
+                row += colored(PIECE_SYMBOLS[piece.type][1], "red", attrs=["bold"])
+        rows.append(row)
+    return "\n".join(rows)
@@ -0,0 +1,10 @@
+from rest_framework.pagination import CursorPagination
+
+
+class HeroCursorPagination(CursorPagination):
+    """newest heroes first, uuid breaks ties between heroes added at once"""
+
+    ordering = ("-added", "-uuid")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
@@ -1,10 +1,30 @@
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from game.models import Hero, Player, HeroInDeck, Deck, PlayerAuthSession
+from game.models import (
+    Hero,
+    Player,
+    HeroInDeck,
+    Deck,
+    PlayerAuthSession,
+    HeroModelSet,
+)
+from game.services.deck_handler import place_heroes
 from game.services.jwt import read_jwt
 
 
+class BulkCreateHeroSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        heroes = [
+            Hero(model_f_id=HeroModelSet.random_id(x["type"]), **x)
+            for x in validated_data
+        ]
+        with transaction.atomic():
+            Hero.objects.bulk_create(heroes)
+        return heroes
+
+
 class CreateHeroSerializer(serializers.ModelSerializer):
     class Meta:
         model = Hero
@@ -14,6 +34,7 @@ class CreateHeroSerializer(serializers.ModelSerializer):
             "attack",
             "speed",
         )
+        list_serializer_class = BulkCreateHeroSerializer
 
 
 class GetHeroSerializer(serializers.ModelSerializer):
@@ -29,7 +50,18 @@ class GetHeroSerializer(serializers.ModelSerializer):
         )
 
 
-class ListHeroSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """limits serialized fields to comma separated `fields` query param"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request and (fields := request.query_params.get("fields")):
+            for name in set(self.fields) - set(fields.split(",")):
+                self.fields.pop(name)
+
+
+class ListHeroSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Hero
         fields = (
@@ -65,40 +97,57 @@ class CreateDeckSerializer(serializers.ModelSerializer):
         model = Deck
         fields = ("hero_ids",)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.heroes = {}
+
     def validate_hero_ids(self, value):
         if len(set(value)) != 16:
             raise ValidationError("Some of the uuids are not unique")
 
+        self.heroes = {
+            hero.uuid: hero
+            for hero in Hero.objects.filter(uuid__in=value).select_related("decks")
+        }
+
         for x in value:
-            if not (hero := Hero.objects.filter(uuid=x)):
+            if not (hero := self.heroes.get(x)):
                 raise ValidationError(f"Hero with uuid {x} doesn't exist")
 
-            if hero.first().player.id != self.context["request"].user.id:
+            if hero.player_id != self.context["request"].user.id:
                 raise ValidationError(
-                    f"Attempt to manipulate player with id {hero.first().player.id} hero"
+                    f"Attempt to manipulate player with id {hero.player_id} hero"
                 )
 
-            if self.context["request"].method in ["POST"]:
-                if deck := HeroInDeck.objects.filter(hero=hero.first()):
-                    raise ValidationError(
-                        f"Hero with uuid {x} is already in deck with id {deck.first().deck.id}"
-                    )
+            # heroes can be only reordered in updated deck
+            deck = getattr(hero, "hero_in_deck", None)
+            if deck and (not self.instance or deck.deck_id != self.instance.id):
+                raise ValidationError(
+                    f"Hero with uuid {x} is already in deck with id {deck.deck_id}"
+                )
 
         return value
 
+    def _add_heroes(self, deck, hero_ids):
+        positions = place_heroes([self.heroes[x].type for x in hero_ids])
+        HeroInDeck.objects.bulk_create(
+            [
+                HeroInDeck(hero_id=x, deck=deck, x=pos_x, y=pos_y)
+                for x, (pos_x, pos_y) in zip(hero_ids, positions)
+            ]
+        )
+        Deck.update_scores([deck.id])
+
     def create(self, validated_data):
-        deck = Deck.objects.create(player=self.context["request"].user)
-        for x in validated_data["hero_ids"]:
-            HeroInDeck.objects.create(hero_id=x, deck=deck)
+        with transaction.atomic():
+            deck = Deck.objects.create(player=self.context["request"].user)
+            self._add_heroes(deck, validated_data["hero_ids"])
         return deck
 
     def update(self, instance, validated_data):
-        for x in instance.get_heroes():
-            HeroInDeck.objects.get(hero=x).delete()
-
-        for x in validated_data["hero_ids"]:
-            HeroInDeck.objects.create(hero_id=x, deck=instance)
-
+        with transaction.atomic():
+            instance.get_heroes().delete()
+            self._add_heroes(instance, validated_data["hero_ids"])
         return instance
 
 
@@ -110,7 +159,7 @@ class GetPlayerSerializer(serializers.ModelSerializer):
 
 class GetDeckSerializer(serializers.ModelSerializer):
     player = GetPlayerSerializer()
-    heroes = ListHeroInDeckSerializer(many=True)
+    heroes = ListHeroInDeckSerializer(source="hero_in_deck", many=True)
 
     class Meta:
         model = Deck
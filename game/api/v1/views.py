@@ -1,3 +1,8 @@
+import hashlib
+
+from django.db.models import Count, Max, Prefetch
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework import status
 
 from rest_framework.generics import GenericAPIView, UpdateAPIView
@@ -11,12 +16,14 @@ from rest_framework.mixins import (
 from rest_framework.response import Response
 
 from game.authentication import PlayerAuthentication
-from game.models import Hero, Deck
+from game.models import Hero, Deck, HeroInDeck
+from game.api.v1.pagination import HeroCursorPagination
 from game.api.v1.serializers import (
     CreateHeroSerializer,
     GetHeroSerializer,
     CreatePlayerSerializer,
     ListHeroSerializer,
+    ListHeroInDeckSerializer,
     CreateDeckSerializer,
     GetDeckSerializer,
     ObtainTokenPairSerializer,
@@ -24,11 +31,23 @@ from game.api.v1.serializers import (
 from game.services.jwt import sign_jwt
 
 
+def hero_list_etag(request, *args, **kwargs):
+    # any hero change bumps max updated, removal changes the count
+    heroes = Hero.objects.filter(player_id=request.user.id).aggregate(
+        count=Count("uuid"), updated=Max("updated")
+    )
+    # cursor and fields change the page, so query string is a part of etag
+    query = request.META.get("QUERY_STRING", "")
+    key = f"{request.user.id}:{heroes['count']}:{heroes['updated']}:{query}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+
 class ListCreateHeroView(GenericAPIView, CreateModelMixin, ListModelMixin):
     authentication_classes = (PlayerAuthentication,)
+    pagination_class = HeroCursorPagination
 
     def perform_create(self, serializer):
-        return serializer.save()
+        return serializer.save(player=self.request.user)
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -36,6 +55,7 @@ class ListCreateHeroView(GenericAPIView, CreateModelMixin, ListModelMixin):
         instance = self.perform_create(serializer)
         return Response({"uuid": instance.uuid}, status=status.HTTP_201_CREATED)
 
+    @method_decorator(condition(etag_func=hero_list_etag))
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
@@ -46,13 +66,36 @@ class ListCreateHeroView(GenericAPIView, CreateModelMixin, ListModelMixin):
             return CreateHeroSerializer
 
     def get_queryset(self):
-        return Hero.objects.filter(player_id=self.request.user.id)
+        return Hero.objects.filter(player_id=self.request.user.id).select_related(
+            "model_f"
+        )
+
+
+class BatchCreateHeroView(GenericAPIView, CreateModelMixin):
+    """creates list of heroes with one insert"""
+
+    serializer_class = CreateHeroSerializer
+    authentication_classes = (PlayerAuthentication,)
+    max_batch = 100
+
+    def perform_create(self, serializer):
+        return serializer.save(player=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(
+            data=request.data, many=True, min_length=1, max_length=self.max_batch
+        )
+        serializer.is_valid(raise_exception=True)
+        heroes = self.perform_create(serializer)
+        return Response(
+            {"uuids": [x.uuid for x in heroes]}, status=status.HTTP_201_CREATED
+        )
 
 
 class RetrieveHeroView(RetrieveModelMixin, UpdateAPIView, GenericAPIView):
     serializer_class = GetHeroSerializer
     lookup_field = "uuid"
-    queryset = Hero.objects.all()
+    queryset = Hero.objects.select_related("model_f")
 
     def get_authenticators(self):
         if self.request.method != "GET":
@@ -82,16 +125,33 @@ class PlayerCreateView(GenericAPIView, CreateModelMixin):
 
         access_jwt = instance.get_access_token()
         refresh_jwt = instance.get_refresh_token()
+        # with FIRST_DECK_ASYNC deck is generated later, see PlayerDeckReadyView
         return Response(
             {
                 "access_token": access_jwt,
                 "refresh_token": refresh_jwt,
-                "deck_id": instance.get_last_deck().id,
+                "deck_ready": instance.deck_ready,
+                "deck_id": instance.get_last_deck().id if instance.deck_ready else None,
             },
             status=status.HTTP_201_CREATED,
         )
 
 
+class PlayerDeckReadyView(GenericAPIView):
+    authentication_classes = (PlayerAuthentication,)
+
+    def get(self, request, *args, **kwargs):
+        deck_id = (
+            Deck.objects.filter(player_id=request.user.id, player__deck_ready=True)
+            .values_list("id", flat=True)
+            .first()
+        )
+        return Response(
+            {"deck_ready": deck_id is not None, "deck_id": deck_id},
+            status=status.HTTP_200_OK,
+        )
+
+
 class DeckCreateView(GenericAPIView, CreateModelMixin):
     serializer_class = CreateDeckSerializer
     authentication_classes = (PlayerAuthentication,)
@@ -103,9 +163,13 @@ class DeckCreateView(GenericAPIView, CreateModelMixin):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         instance = self.perform_create(serializer)
-        heroes_list = ListHeroSerializer(instance.get_heroes(), many=True)
-        heroes_list.data["deck_id"] = instance.id
-        return Response(heroes_list.data, status=status.HTTP_201_CREATED)
+        heroes_list = ListHeroInDeckSerializer(
+            instance.get_heroes().select_related("hero__model_f"), many=True
+        )
+        return Response(
+            {"deck_id": instance.id, "heroes": heroes_list.data},
+            status=status.HTTP_201_CREATED,
+        )
 
 
 class RetireUpdateDeleteDeckView(
@@ -120,11 +184,22 @@ class RetireUpdateDeleteDeckView(
         else:
             return CreateDeckSerializer
 
+    def get_queryset(self):
+        if self.request.method == "GET":
+            # deck with its player, heroes and their models in two queries
+            return self.queryset.select_related("player").prefetch_related(
+                Prefetch(
+                    "hero_in_deck",
+                    queryset=HeroInDeck.objects.select_related("hero__model_f"),
+                )
+            )
+        return self.queryset
+
     def get(self, request, *args, **kwargs):
         return self.retrieve(request, *args, **kwargs)
 
     def perform_update(self, serializer):
-        return serializer.update(self.get_object(), self.request.data)
+        return serializer.save()
 
     def put(self, request, *args, **kwargs):
         if not self._check_user_identity(kwargs["id"]):
@@ -132,10 +207,12 @@ class RetireUpdateDeleteDeckView(
                 "Attempt to change another user's deck",
                 status=status.HTTP_403_FORBIDDEN,
             )
-        serializer = self.get_serializer(data=request.data)
+        serializer = self.get_serializer(self.get_object(), data=request.data)
         serializer.is_valid(raise_exception=True)
         instance = self.perform_update(serializer)
-        heroes_list = ListHeroSerializer(instance.get_heroes(), many=True)
+        heroes_list = ListHeroInDeckSerializer(
+            instance.get_heroes().select_related("hero__model_f"), many=True
+        )
         return Response(heroes_list.data, status=status.HTTP_200_OK)
 
     def delete(self, request, *args, **kwargs):
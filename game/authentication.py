@@ -1,9 +1,17 @@
-from jwt import DecodeError
+from django.conf import settings
+from jwt import InvalidTokenError
 from rest_framework import authentication
 from rest_framework import exceptions
+
+from common.cache import TTLCache
 from .models import Player
 from .services.jwt import read_jwt
 
+# players by id, entries are dropped on player change by game.signals
+authenticated_players = TTLCache(
+    maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_PLAYER_CACHE_TTL
+)
+
 
 class PlayerAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
@@ -15,7 +23,7 @@ class PlayerAuthentication(authentication.BaseAuthentication):
 
         try:
             t = read_jwt(token)
-        except DecodeError:
+        except InvalidTokenError:
             raise exceptions.AuthenticationFailed("Token is incorrect")
 
         if not t:
@@ -27,9 +35,11 @@ class PlayerAuthentication(authentication.BaseAuthentication):
         if t["type"] != "access":
             raise exceptions.AuthenticationFailed("Incorrect token type")
 
-        try:
-            user = Player.objects.get(id=int(t["id"]))
-        except Player.DoesNotExist:
-            raise exceptions.AuthenticationFailed("No such user")
+        if not (user := authenticated_players.get(int(t["id"]))):
+            try:
+                user = Player.objects.get(id=int(t["id"]))
+            except Player.DoesNotExist:
+                raise exceptions.AuthenticationFailed("No such user")
+            authenticated_players.set(user.id, user)
 
         return user, None
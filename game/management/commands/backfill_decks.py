@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from game.models import Deck, Player
+
+
+class Command(BaseCommand):
+    help = "Recounts stored scores of existing decks and marks their players ready"
+
+    def handle(self, *args, **options):
+        # scores of decks created before total_score was stored are 0
+        Deck.update_scores(Deck.objects.values("id"))
+        self.stdout.write(f"{Deck.objects.count()} deck scores recounted")
+
+        # players that got their first deck before deck_ready was stored
+        players = Player.objects.filter(deck_ready=False, deck__isnull=False)
+        updated = Player.objects.filter(id__in=players).update(deck_ready=True)
+        self.stdout.write(f"{updated} players marked ready")
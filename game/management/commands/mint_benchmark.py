@@ -0,0 +1,52 @@
+import random
+import time
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from common.generators import generate_charset
+from game.models import HeroTypes, Player
+
+
+class Command(BaseCommand):
+    help = "Mints heroes one by one and with batch endpoint, prints timings"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-n", "--heroes", type=int, default=50)
+
+    def handle(self, *args, **options):
+        heroes = [
+            {
+                "type": random.choice(HeroTypes.values),
+                "health": random.randint(1, 10),
+                "attack": random.randint(1, 10),
+                "speed": random.randint(1, 10),
+            }
+            for _ in range(options["heroes"])
+        ]
+        # everything benchmark creates is rolled back
+        with transaction.atomic():
+            player = Player.objects.create(
+                ton_wallet=generate_charset(48), name="bench"
+            )
+            client = APIClient()
+            client.force_authenticate(player)
+
+            for name, requests in [
+                ("sequential", [("/api/v1/hero/", hero) for hero in heroes]),
+                ("batch", [("/api/v1/hero/batch", heroes)]),
+            ]:
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for url, data in requests:
+                        response = client.post(url, data, format="json")
+                        assert response.status_code == 201, response.data
+                    spent = time.perf_counter() - start
+
+                self.stdout.write(
+                    f"{name:<12}{len(heroes)} heroes in {spent * 1000:.1f} ms, "
+                    f"{len(queries)} queries"
+                )
+            transaction.set_rollback(True)
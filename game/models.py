@@ -1,5 +1,6 @@
 import random
 import uuid
+from collections import defaultdict
 
 from django.core.validators import (
     MinValueValidator,
@@ -8,8 +9,11 @@ from django.core.validators import (
     MaxLengthValidator,
 )
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 
 from chess_backend import settings
+from common.cache import TTLCache
 from common.generators import generate_charset
 from game.services.jwt import sign_jwt
 
@@ -21,6 +25,10 @@ class HeroTypes(models.TextChoices):
     king = "KING", "king"
 
 
+# model set ids by hero type, cleared on HeroModelSet change by game.signals
+hero_model_ids = TTLCache(maxsize=len(HeroTypes), ttl=settings.HERO_MODEL_CACHE_TTL)
+
+
 class Player(models.Model):
     """base model to handle and store users"""
 
@@ -32,6 +40,8 @@ class Player(models.Model):
     )
     name = models.CharField(max_length=100, blank=True)
     created = models.DateTimeField(auto_now_add=True)
+    # set when first deck is generated, see game.signals.create_player
+    deck_ready = models.BooleanField(default=False)
 
     def get_last_deck(self):
         return Deck.objects.filter(player=self).last()
@@ -73,6 +83,7 @@ class Hero(models.Model):
         related_query_name="hero",
     )
     added = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
 
     type = models.CharField(blank=False, choices=HeroTypes.choices, max_length=7)
     model_f = models.ForeignKey("HeroModelSet", on_delete=models.CASCADE)
@@ -92,14 +103,31 @@ class Hero(models.Model):
     def __str__(self):
         return f"{self.type} {self.player.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Hero, cls).from_db(db, field_names, values)
+        # type saved in db, model is picked again when it changes
+        if "type" in field_names:
+            instance._saved_type = values[field_names.index("type")]
+        return instance
+
     def save(
         self, force_insert=False, force_update=False, using=None, update_fields=None
     ):
-        self.model_f = random.choice(HeroModelSet.objects.filter(hero_type=self.type))
+        # model is picked for hero's type, stats updates keep it
+        retyped = self.type != getattr(self, "_saved_type", self.type)
+        if (self._state.adding and not self.model_f_id) or retyped:
+            self.model_f_id = HeroModelSet.random_id(self.type)
+            if update_fields is not None:
+                update_fields = {*update_fields, "model_f"}
         super(Hero, self).save(force_insert, force_update, using, update_fields)
+        self._saved_type = self.type
 
     class Meta:
-        indexes = [models.Index(fields=["uuid"])]
+        indexes = [
+            models.Index(fields=["uuid"]),
+            models.Index(fields=["player", "-added", "-uuid"]),
+        ]
         ordering = ["-added"]
 
         db_table = "hero"
@@ -114,6 +142,23 @@ class HeroModelSet(models.Model):
     def __str__(self):
         return f"{self.hero_type} model file"
 
+    @classmethod
+    def get_ids(cls, hero_type: str) -> list[int]:
+        """cached ids of model sets for hero type, all types are loaded at once"""
+        ids = hero_model_ids.get(hero_type)
+        if ids is None:
+            by_type = defaultdict(list)
+            for t, model_id in cls.objects.values_list("hero_type", "id"):
+                by_type[t].append(model_id)
+            for t in HeroTypes.values:
+                hero_model_ids.set(t, by_type[t])
+            ids = by_type[hero_type]
+        return ids
+
+    @classmethod
+    def random_id(cls, hero_type: str) -> int:
+        return random.choice(cls.get_ids(hero_type))
+
 
 class Deck(models.Model):
     player = models.ForeignKey(
@@ -122,6 +167,8 @@ class Deck(models.Model):
         related_name="decks",
         related_query_name="deck",
     )
+    # sum of heroes' stats, kept up to date by game.signals
+    total_score = models.IntegerField(default=0)
 
     def __str__(self):
         return f"{self.player.name}'s deck"
@@ -133,8 +180,21 @@ class Deck(models.Model):
         return self.get_heroes()
 
     def score(self):
-        return sum(
-            [x.hero.attack + x.hero.health + x.hero.speed for x in self.get_heroes()]
+        return self.total_score
+
+    @classmethod
+    def update_scores(cls, deck_ids):
+        """recounts score of decks with one query, deck_ids can be a queryset"""
+        score = (
+            HeroInDeck.objects.filter(deck=OuterRef("pk"))
+            .values("deck")
+            .annotate(
+                score=Sum(F("hero__attack") + F("hero__health") + F("hero__speed"))
+            )
+            .values("score")
+        )
+        cls.objects.filter(id__in=deck_ids).update(
+            total_score=Coalesce(Subquery(score), 0)
         )
 
     class Meta:
@@ -1,49 +1,74 @@
 import random
 
-from game.models import Deck, Player, HeroTypes, Hero, HeroInDeck
+from django.db import transaction
 
+from game.models import Deck, Player, HeroTypes, Hero, HeroInDeck, HeroModelSet
 
-def create_first_deck(player: Player):
-    deck = Deck.objects.create(player=player)
-    positions = []
+# squares on deck reserved for the first king and wizard
+FIXED_POSITIONS = {"KING": (5, 1), "WIZARD": (4, 1)}
 
-    for x in range(1, 9):
-        for y in range(1, 3):
-            positions.append((x, y))
-    positions.remove((4, 1))
-    positions.remove((5, 1))
-    random.shuffle(positions)
 
-    types = ["KING", "WIZARD"] + ["ARCHER" for _ in range(4)] + ["WARRIOR" for _ in range(6)]
+def place_heroes(types: list[str], shuffle: bool = False) -> list[tuple[int, int]]:
+    """positions on deck for heroes of given types"""
+    positions = [None] * len(types)
+    fixed = dict(FIXED_POSITIONS)
+    for i, t in enumerate(types):
+        if t in fixed:
+            positions[i] = fixed.pop(t)
+
+    free = [(x, y) for y in range(1, 3) for x in range(1, 9) if (x, y) not in positions]
+    if shuffle:
+        random.shuffle(free)
+
+    for i, position in enumerate(positions):
+        if not position:
+            positions[i] = free.pop(0)
+    return positions
+
+
+def first_deck_types() -> list[str]:
+    """king, wizard, 4 archers, 6 warriors and 4 random heroes, at most 2 wizards"""
+    types = (
+        ["KING", "WIZARD"]
+        + ["ARCHER" for _ in range(4)]
+        + ["WARRIOR" for _ in range(6)]
+    )
 
     for _ in range(4):
         t = random.choice(HeroTypes.choices[:3])[0]
         if t == "WIZARD" and types.count("WIZARD") > 1:
             t = random.choice(HeroTypes.choices[:2])[0]
         types.append(t)
+    return types
+
+
+def create_first_deck(player: Player) -> Deck:
+    types = first_deck_types()
+    heroes = [
+        Hero(
+            player=player,
+            type=t,
+            model_f_id=HeroModelSet.random_id(t),
+            health=random.randint(1, 10),
+            attack=random.randint(1, 10),
+            speed=random.randint(1, 10),
+        )
+        for t in types
+    ]
+
+    with transaction.atomic():
+        deck = Deck.objects.create(
+            player=player,
+            total_score=sum(x.health + x.attack + x.speed for x in heroes),
+        )
+        Hero.objects.bulk_create(heroes)
+        HeroInDeck.objects.bulk_create(
+            [
+                HeroInDeck(deck=deck, hero=hero, x=pos_x, y=pos_y)
+                for hero, (pos_x, pos_y) in zip(heroes, place_heroes(types, True))
+            ]
+        )
+        Player.objects.filter(id=player.id).update(deck_ready=True)
 
-    counter = 0
-    for t in types:
-        hero = Hero()
-        hero.player = player
-        hero.type = t
-
-        # set random position on deck for heroes
-        if t == "KING":
-            pos_x = 5
-            pos_y = 1
-        elif t == "WIZARD":
-            pos_x = 4
-            pos_y = 1
-        else:
-            pos_x = positions[counter][0]
-            pos_y = positions[counter][1]
-
-            counter += 1
-
-        hero.health = random.randint(1, 10)
-        hero.attack = random.randint(1, 10)
-        hero.speed = random.randint(1, 10)
-
-        hero.save()
-        HeroInDeck.objects.create(deck=deck, hero=hero, x=pos_x, y=pos_y)
+    player.deck_ready = True
+    return deck
@@ -1,3 +1,5 @@
+import hashlib
+
 import jwt
 import pytz
 
@@ -5,8 +7,18 @@ from datetime import datetime
 from django.conf import settings
 from jwt import ExpiredSignatureError, InvalidSignatureError
 
+from common.cache import TTLCache
+
 TIMEZONE = pytz.timezone("Europe/Moscow")
 
+# all tokens are signed with the same algorithm and key, so both are
+# prepared once instead of being read from token header on every check
+ALGORITHM = "HS256"
+SECRET = settings.SECRET_KEY.encode()
+
+# verified payloads by token digest, kept till token expiration
+verified_tokens = TTLCache(maxsize=settings.AUTH_CACHE_SIZE)
+
 
 def sign_jwt(data: dict, t_life: None | int = None) -> str:
     """generate and sign jwt with iat and exp using data from settings"""
@@ -17,17 +29,18 @@ def sign_jwt(data: dict, t_life: None | int = None) -> str:
         if nm not in ["iat", "exp"]:
             payload[nm] = el
 
-    secret = settings.SECRET_KEY
-    token = jwt.encode(payload=payload, key=secret)
+    token = jwt.encode(payload=payload, key=SECRET, algorithm=ALGORITHM)
     return token
 
 
 def read_jwt(token: str) -> dict | bool:
     """reads jwt, validates it and return payload if correct"""
-    header_data = jwt.get_unverified_header(token)
-    secret = settings.SECRET_KEY
+    digest = hashlib.sha256(token.encode()).digest()
+    if cached := verified_tokens.get(digest):
+        return dict(cached)
+
     try:
-        payload = jwt.decode(token, key=secret, algorithms=[header_data["alg"]])
+        payload = jwt.decode(token, key=SECRET, algorithms=[ALGORITHM])
     except ExpiredSignatureError as e:
         return False
     except InvalidSignatureError as e:
@@ -40,6 +53,7 @@ def read_jwt(token: str) -> dict | bool:
         return False
 
     payload.pop("iat", None)
-    payload.pop("exp", None)
+    exp = payload.pop("exp")
 
+    verified_tokens.set(digest, dict(payload), expires=exp)
     return payload
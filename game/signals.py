@@ -1,11 +1,65 @@
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import Player, PlayerAuthSession
+from .authentication import authenticated_players
+from .models import (
+    Player,
+    PlayerAuthSession,
+    Hero,
+    HeroInDeck,
+    Deck,
+    HeroModelSet,
+    hero_model_ids,
+)
 from .services.deck_handler import create_first_deck
+from .tasks import create_first_deck_task
 
 
 @receiver(post_save, sender=Player)
 def create_player(sender, instance, created, **kwargs):
     if created:
         PlayerAuthSession.objects.create(player=instance)
-        create_first_deck(instance)
+        if settings.FIRST_DECK_ASYNC:
+            transaction.on_commit(lambda: create_first_deck_task.delay(instance.id))
+        else:
+            create_first_deck(instance)
+
+
+@receiver(post_save, sender=Player)
+@receiver(post_delete, sender=Player)
+def drop_cached_player(sender, instance, **kwargs):
+    authenticated_players.pop(instance.id)
+
+
+# there are no delete receivers for HeroInDeck, so decks can be cleared
+# with one query, heroes removed from decks by deletion are handled below
+@receiver(post_save, sender=HeroInDeck)
+def update_deck_score(sender, instance, **kwargs):
+    Deck.update_scores([instance.deck_id])
+
+
+@receiver(post_save, sender=Hero)
+def update_hero_deck_score(sender, instance, created, **kwargs):
+    # new hero can't be in deck yet
+    if not created:
+        Deck.update_scores(HeroInDeck.objects.filter(hero=instance).values("deck_id"))
+
+
+@receiver(pre_delete, sender=Hero)
+def remember_hero_deck(sender, instance, **kwargs):
+    instance.deleted_from_deck = list(
+        HeroInDeck.objects.filter(hero=instance).values_list("deck_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Hero)
+def update_deleted_hero_deck_score(sender, instance, **kwargs):
+    if instance.deleted_from_deck:
+        Deck.update_scores(instance.deleted_from_deck)
+
+
+@receiver(post_save, sender=HeroModelSet)
+@receiver(post_delete, sender=HeroModelSet)
+def drop_cached_model_ids(sender, **kwargs):
+    hero_model_ids.clear()
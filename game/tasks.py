@@ -0,0 +1,11 @@
+from celery import shared_task
+
+from game.models import Player
+from game.services.deck_handler import create_first_deck
+
+
+@shared_task
+def create_first_deck_task(player_id: int):
+    player = Player.objects.get(id=player_id)
+    if not player.deck_ready:
+        create_first_deck(player)
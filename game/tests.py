@@ -0,0 +1,363 @@
+from io import StringIO
+from unittest import mock
+
+import jwt as pyjwt
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from common.generators import generate_charset
+from game.authentication import PlayerAuthentication, authenticated_players
+from game.models import Deck, Hero, HeroModelSet, HeroTypes, Player, hero_model_ids
+from game.services import jwt as jwt_service
+from game.services.jwt import read_jwt, sign_jwt, verified_tokens
+
+
+def create_model_sets():
+    HeroModelSet.objects.bulk_create(
+        [
+            HeroModelSet(hero_type=hero_type, model=f"uploads/{hero_type}.glb")
+            for hero_type in HeroTypes.values
+        ]
+    )
+    # bulk_create sends no signals, ids of previous test data can be cached
+    hero_model_ids.clear()
+
+
+class FirstDeckTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_model_sets()
+
+    def test_signup(self):
+        HeroModelSet.get_ids("KING")
+
+        # player, session, deck and tokens, deck is written in a transaction
+        with self.assertNumQueries(11):
+            response = self.client.post(
+                "/api/v1/player/", {"ton_wallet": generate_charset(48)}
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data["deck_ready"])
+
+        deck = Deck.objects.get(id=response.data["deck_id"])
+        squares = set(deck.get_heroes().values_list("x", "y"))
+        self.assertEqual(len(squares), 16)
+
+        score = deck.score()
+        Deck.update_scores([deck.id])
+        deck.refresh_from_db()
+        self.assertEqual(deck.score(), score)
+
+    def test_backfill(self):
+        player = Player.objects.create(ton_wallet=generate_charset(48))
+        deck = player.get_last_deck()
+        score = deck.score()
+        Deck.objects.filter(id=deck.id).update(total_score=0)
+        Player.objects.filter(id=player.id).update(deck_ready=False)
+
+        call_command("backfill_decks", stdout=StringIO())
+        deck.refresh_from_db()
+        self.assertEqual(deck.score(), score)
+        player.refresh_from_db()
+        self.assertTrue(player.deck_ready)
+
+
+class HeroModelTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_model_sets()
+        cls.player = Player.objects.create(
+            ton_wallet=generate_charset(48), name="player"
+        )
+
+    def test_model_kept_on_update(self):
+        hero = Hero.objects.filter(player=self.player).first()
+        model_id = hero.model_f_id
+
+        hero.speed = hero.speed % 10 + 1
+        # hero and its deck score updates
+        with self.assertNumQueries(2):
+            hero.save()
+        self.assertEqual(hero.model_f_id, model_id)
+
+    def test_model_picked_on_type_change(self):
+        hero = Hero.objects.filter(player=self.player, type="WARRIOR").first()
+        hero.type = "KING"
+        hero.save()
+
+        hero.refresh_from_db()
+        self.assertEqual(hero.model_f.hero_type, "KING")
+
+    def test_cache_dropped_on_change(self):
+        model_set = HeroModelSet.objects.create(hero_type="KING", model="uploads/k.glb")
+        self.assertIn(model_set.id, HeroModelSet.get_ids("KING"))
+
+        model_set.delete()
+        self.assertNotIn(model_set.id, HeroModelSet.get_ids("KING"))
+
+
+class BatchCreateHeroTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_model_sets()
+        cls.player = Player.objects.create(ton_wallet=generate_charset(48))
+
+    def setUp(self):
+        self.client.force_authenticate(self.player)
+        self.url = reverse("hero_api_batch")
+        self.heroes = [
+            {"type": hero_type, "health": 5, "attack": 5, "speed": 5}
+            for hero_type in HeroTypes.values * 5
+        ]
+
+    def test_batch_create(self):
+        response = self.client.post(self.url, self.heroes, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["uuids"]), 20)
+        self.assertEqual(
+            Hero.objects.filter(uuid__in=response.data["uuids"]).count(), 20
+        )
+
+    def test_invalid_hero_rejects_batch(self):
+        self.heroes[-1]["speed"] = 11
+        response = self.client.post(self.url, self.heroes, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Hero.objects.filter(player=self.player).count(), 16)
+
+
+def create_heroes(player: Player, count: int = 16) -> list[Hero]:
+    return Hero.objects.bulk_create(
+        [
+            Hero(
+                player=player,
+                type=hero_type,
+                model_f_id=HeroModelSet.random_id(hero_type),
+                health=3,
+                attack=4,
+                speed=5,
+            )
+            for hero_type in (HeroTypes.values * count)[:count]
+        ]
+    )
+
+
+class DeckTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_model_sets()
+        cls.player = Player.objects.create(ton_wallet=generate_charset(48))
+        cls.deck = cls.player.get_last_deck()
+        cls.heroes = [str(x.uuid) for x in create_heroes(cls.player)]
+
+    def setUp(self):
+        self.client.force_authenticate(self.player)
+        self.url = reverse("deck_retire_api", kwargs={"id": self.deck.id})
+
+    def test_create(self):
+        # heroes, deck with its heroes and score in a savepoint, response
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                reverse("deck_create_api"), {"hero_ids": self.heroes}, format="json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["heroes"]), 16)
+        deck = Deck.objects.get(id=response.data["deck_id"])
+        self.assertEqual(deck.score(), 16 * 12)
+
+    def test_another_players_hero(self):
+        other = Player.objects.create(ton_wallet=generate_charset(48))
+        self.heroes[0] = str(create_heroes(other, 1)[0].uuid)
+        response = self.client.post(
+            reverse("deck_create_api"), {"hero_ids": self.heroes}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_hero_in_another_deck(self):
+        self.heroes[0] = str(self.deck.get_heroes().first().hero_id)
+        response = self.client.post(
+            reverse("deck_create_api"), {"hero_ids": self.heroes}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update(self):
+        # owner check and deck are read first, heroes are replaced at once
+        with self.assertNumQueries(9):
+            response = self.client.put(
+                self.url, {"hero_ids": self.heroes}, format="json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {str(x) for x in self.deck.get_heroes().values_list("hero_id", flat=True)},
+            set(self.heroes),
+        )
+        self.deck.refresh_from_db()
+        self.assertEqual(self.deck.score(), 16 * 12)
+
+    def test_reorder(self):
+        heroes = [
+            str(x) for x in self.deck.get_heroes().values_list("hero_id", flat=True)
+        ]
+        response = self.client.put(self.url, {"hero_ids": heroes[::-1]}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({x["hero"]["uuid"] for x in response.data}, set(heroes))
+
+    def test_score_after_hero_delete(self):
+        hero = self.deck.get_heroes().select_related("hero").first().hero
+        score = self.deck.score()
+        hero.delete()
+
+        self.deck.refresh_from_db()
+        self.assertEqual(
+            self.deck.score(), score - hero.health - hero.attack - hero.speed
+        )
+
+
+class ReadQueriesTest(APITestCase):
+    """deck and hero reads shouldn't depend on the number of heroes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_model_sets()
+        cls.player = Player.objects.create(
+            ton_wallet=generate_charset(48), name="player"
+        )
+        cls.deck = cls.player.get_last_deck()
+
+    def setUp(self):
+        self.client.force_authenticate(self.player)
+
+    def test_deck_retrieve(self):
+        url = reverse("deck_retire_api", kwargs={"id": self.deck.id})
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["heroes"]), 16)
+        self.assertTrue(all(x["hero"]["model"] for x in response.data["heroes"]))
+
+    def test_hero_list(self):
+        # etag aggregate and the page itself
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("hero_api_create"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 16)
+
+
+class HeroListTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_model_sets()
+        cls.player = Player.objects.create(
+            ton_wallet=generate_charset(48), name="player"
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.player)
+        self.url = reverse("hero_api_create")
+
+    def test_cursor_pagination(self):
+        uuids = []
+        response = self.client.get(self.url, {"page_size": 5})
+        while True:
+            self.assertLessEqual(len(response.data["results"]), 5)
+            uuids += [x["uuid"] for x in response.data["results"]]
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+
+        self.assertEqual(len(uuids), 16)
+        self.assertEqual(len(set(uuids)), 16)
+
+    def test_sparse_fields(self):
+        response = self.client.get(self.url, {"fields": "uuid,type"})
+        self.assertEqual(set(response.data["results"][0]), {"uuid", "type"})
+
+    def test_etag(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        hero = self.player.heroes.first()
+        hero.attack = hero.attack % 10 + 1
+        hero.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class TokenCacheTest(SimpleTestCase):
+    def setUp(self):
+        verified_tokens.clear()
+
+    def test_cache_hit(self):
+        token = sign_jwt({"id": 1, "type": "access"}, t_life=60)
+        with mock.patch.object(jwt_service.jwt, "decode", wraps=pyjwt.decode) as decode:
+            self.assertEqual(read_jwt(token), {"id": 1, "type": "access"})
+            self.assertEqual(read_jwt(token), {"id": 1, "type": "access"})
+        decode.assert_called_once()
+
+    def test_expires_with_token(self):
+        token = sign_jwt({"id": 1, "type": "access"}, t_life=60)
+        exp = pyjwt.decode(token, options={"verify_signature": False})["exp"]
+        read_jwt(token)
+
+        with mock.patch.object(jwt_service.jwt, "decode", wraps=pyjwt.decode) as decode:
+            with mock.patch("common.cache.time.time", return_value=exp - 1):
+                read_jwt(token)
+            decode.assert_not_called()
+            with mock.patch("common.cache.time.time", return_value=exp + 1):
+                read_jwt(token)
+            decode.assert_called_once()
+
+    def test_invalid_token(self):
+        token = pyjwt.encode({"id": 1, "type": "access"}, "other", algorithm="HS256")
+        self.assertFalse(read_jwt(token))
+        self.assertEqual(len(verified_tokens), 0)
+
+
+class PlayerCacheTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_model_sets()
+        cls.player = Player.objects.create(ton_wallet=generate_charset(48))
+
+    def setUp(self):
+        authenticated_players.clear()
+        self.request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION=self.player.get_access_token()
+        )
+
+    def authenticate(self):
+        return PlayerAuthentication().authenticate(self.request)[0]
+
+    def test_cache_hit(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(), self.player)
+
+    def test_dropped_on_save(self):
+        self.authenticate()
+        self.player.name = "renamed"
+        self.player.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().name, "renamed")
+
+    def test_dropped_on_delete(self):
+        self.authenticate()
+        self.player.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
@@ -2,8 +2,10 @@ from django.urls import path
 
 from game.api.v1.views import (
     ListCreateHeroView,
+    BatchCreateHeroView,
     RetrieveHeroView,
     PlayerCreateView,
+    PlayerDeckReadyView,
     DeckCreateView,
     RetireUpdateDeleteDeckView,
     RefreshAuthKey,
@@ -11,9 +13,11 @@ from game.api.v1.views import (
 
 urlpatterns = [
     path("v1/hero/", ListCreateHeroView.as_view(), name="hero_api_create"),
+    path("v1/hero/batch", BatchCreateHeroView.as_view(), name="hero_api_batch"),
     path("v1/hero/<uuid:uuid>", RetrieveHeroView.as_view(), name="hero_api_retrieve"),
     path("v1/player/refresh", RefreshAuthKey.as_view(), name="player_create_api"),
     path("v1/player/", PlayerCreateView.as_view(), name="player_create_api"),
+    path("v1/player/ready", PlayerDeckReadyView.as_view(), name="player_ready_api"),
     path("v1/deck/", DeckCreateView.as_view(), name="deck_create_api"),
     path(
         "v1/deck/<int:id>", RetireUpdateDeleteDeckView.as_view(), name="deck_retire_api"
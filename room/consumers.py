@@ -1,26 +1,63 @@
-import json
+import asyncio
+import logging
 import os
 import django
 
+from urllib.parse import parse_qs
+
 from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 
-from room.services.game_logic import move_handler
+from room.services.codecs import negotiate_codec
+from room.services.room_actor import join_actor
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "chess_backend.settings")
 django.setup()
 
 from game.models import Deck
-from room.models import PlayerInQueue, Room, PlayerInRoom, GameState
+from room.models import PlayerInRoom
+from room.services.matchmaking import QueueEntry
+from room.services.queue_backend import get_queue_backend
 from room.services.room_create import create_room
+from room.services.room_join import get_room_snapshot, get_seat_states, room_snapshots
+from room.services.presence import get_presence_backend
+from room.services.room_session import RoomSession, resume_session, save_session
+from room.services.spectators import join_feed
+from room.services.write_behind import RoomOwnedElsewhere
+
+logger = logging.getLogger(__name__)
 
 
 class BaseConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(args, kwargs)
+        self.codec = None
+
+    async def accept(self, subprotocol=None):
+        # codec is chosen by websocket subprotocol, json is used by default
+        self.codec = negotiate_codec(self.scope.get("subprotocols", []))
+        if self.codec.name in self.scope.get("subprotocols", []):
+            subprotocol = self.codec.name
+        await super().accept(subprotocol)
 
     async def send_message(self, message_type: str, **data):
-        await self.send(text_data=json.dumps({"type": message_type, **data}))
+        await self.send_frame(self.codec.encode({"type": message_type, **data}))
+
+    async def send_frame(self, frame: str | bytes):
+        # frame is a message already encoded with connection's codec
+        if self.codec.binary:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
+    async def read_message(self, text_data=None, bytes_data=None) -> dict | None:
+        try:
+            return self.codec.decode(text_data if text_data is not None else bytes_data)
+        except ValueError:
+            await self.send_message(
+                "ERROR", message=f"data is not {self.codec.name} serializable"
+            )
 
 
 class QueueConsumer(BaseConsumer):
@@ -49,13 +86,8 @@ class QueueConsumer(BaseConsumer):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
     # Receive message from WebSocket
-    async def receive(self, text_data):
-        data = None
-
-        try:
-            data = json.loads(text_data)
-        except ValueError:
-            await self.send_message("ERROR", message="data is not JSON serializable")
+    async def receive(self, text_data=None, bytes_data=None):
+        data = await self.read_message(text_data, bytes_data)
 
         if data:
             # TODO move to external function/class
@@ -93,17 +125,27 @@ class QueueConsumer(BaseConsumer):
                                 )
                             else:
                                 # add to group and send message that opponent found to players
-                                room = await create_room(
-                                    deck_id_1=self.scope["deck"],
-                                    player_id_1=self.scope["player"],
-                                    player_score_1=self.scope["score"],
-                                    deck_id_2=opponent[2],
-                                    player_id_2=opponent[3],
-                                    player_score_2=opponent[1],
-                                )
+                                try:
+                                    room = await create_room(
+                                        deck_id_1=self.scope["deck"],
+                                        player_id_1=self.scope["player"],
+                                        player_score_1=self.scope["score"],
+                                        deck_id_2=opponent.deck_id,
+                                        player_id_2=opponent.player_id,
+                                        player_score_2=opponent.score,
+                                    )
+                                except Exception:
+                                    # both players were claimed, they go back to queue
+                                    logger.exception("failed to create room")
+                                    await self.requeue(opponent)
+                                    await self.send_message(
+                                        "ERROR",
+                                        message="room wasn't created, awaiting in queue",
+                                    )
+                                    return
 
                                 await self.channel_layer.send(
-                                    opponent[0],
+                                    opponent.channel_name,
                                     {
                                         "type": "info",
                                         "message": f"user found, with score {self.scope['score']}",
@@ -113,7 +155,7 @@ class QueueConsumer(BaseConsumer):
 
                                 await self.send_message(
                                     "INFO",
-                                    message=f"user found, with score {opponent[1]}",
+                                    message=f"user found, with score {opponent.score}",
                                     room=room,
                                 )
                         else:
@@ -123,10 +165,7 @@ class QueueConsumer(BaseConsumer):
 
     @sync_to_async
     def delete_user_in_queue(self):
-        try:
-            PlayerInQueue.objects.get(player_id=self.scope["player"])
-        except PlayerInQueue.DoesNotExist:
-            return False
+        return bool(get_queue_backend().discard(self.scope["player"]))
 
     @sync_to_async
     def check_user_already_in_room(self):
@@ -142,19 +181,27 @@ class QueueConsumer(BaseConsumer):
 
     @sync_to_async
     def find_user_by_score(self):
-        s_min = self.scope["score"] * 0.95
-        s_max = self.scope["score"] * 1.05
-        for el in PlayerInQueue.objects.all():
-            if el.player_id != self.scope["player"]:
-                if s_min <= el.score <= s_max:
-                    return el.channel_name, el.score, el.deck.id, el.player.id
-        return False
+        return get_queue_backend().claim_nearest(
+            self.scope["player"], self.scope["score"]
+        )
+
+    @sync_to_async
+    def requeue(self, opponent: QueueEntry):
+        backend = get_queue_backend()
+        backend.add(*opponent)
+        backend.add(
+            self.scope["player"],
+            self.channel_name,
+            self.scope["deck"],
+            self.scope["score"],
+            self.scope["joined"],
+        )
 
     @sync_to_async
     def check_user_deck(self, deck_id: int):
         try:
             deck = Deck.objects.get(id=deck_id)
-            if deck.player.id != self.scope["player"]:
+            if deck.player_id != self.scope["player"]:
                 return False
             return deck
         except Deck.DoesNotExist:
@@ -162,23 +209,13 @@ class QueueConsumer(BaseConsumer):
 
     @sync_to_async
     def queue_connector(self, deck):
-        try:
-            queue = PlayerInQueue.objects.get(player_id=self.scope["player"])
-            queue.score = deck.score()
-            queue.channel_name = self.channel_name
-            queue.save()
-
-        except PlayerInQueue.DoesNotExist:
-            queue = PlayerInQueue.objects.create(
-                player_id=self.scope["player"],
-                deck=deck,
-                score=deck.score(),
-                channel_name=self.channel_name,
-            )
+        queue = get_queue_backend().add(
+            self.scope["player"], self.channel_name, deck.id, deck.score()
+        )
 
-        self.scope["queue"] = queue.id
         self.scope["deck"] = deck.id
         self.scope["score"] = queue.score
+        self.scope["joined"] = queue.joined
 
     async def info(self, event):
         if "room" in event:
@@ -199,49 +236,91 @@ class RoomConsumer(BaseConsumer):
         super().__init__(*args, **kwargs)
         self.room_group_name = None
         self.room_name = None
+        self.actor = None
+        self.session = None
+        self.presence = get_presence_backend()
+        self._heartbeat = None
+        self._notify = None
+        self._notified_online = None
+        self.version = 0  # board version client has
 
     async def connect(self):
         await self.accept()
         await self.check_origin()
 
-        if not await self.connect_to_room():
+        slug = self.scope["url_route"]["kwargs"]["room_name"]
+        query = parse_qs(self.scope["query_string"].decode())
+
+        # player reconnected within grace window gets room context from session
+        session = None
+        if token := query.get("session"):
+            session = resume_session(slug, self.scope["player"], token[0])
+
+        if session:
+            await self.resume(slug, session)
+        elif not await self.connect_to_room():
             await self.close()
-        else:
-            message, round = await self.get_state()
+            return
 
-            await self.send_message(
-                "INFO",
-                opponent_score=self.scope["opponent_score"],
-                opponent_deck=self.scope["opponent_deck"],
-                opponent_online=self.scope["opponent_online"],
-                first=self.scope["first"],
-                state=message,
-                round=round,
+        try:
+            self.actor = await join_actor(
+                self.scope["room"], self.scope["first_player"]
             )
-            if "opponent_channel" in self.scope and self.scope["opponent_channel"]:
-                await self.channel_layer.send(
-                    self.scope["opponent_channel"],
-                    {
-                        "type": "channel",
-                        "channel": self.channel_name,
-                    },
-                )
-                await self.channel_layer.send(
-                    self.scope["opponent_channel"],
-                    {"type": "connection_info", "online": True},
-                )
-
-            # Join room group
-            await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-
-            # load and send board
-            await self.load_board()
+        except RoomOwnedElsewhere:
+            # connections to room must be routed to the process serving it
+            await self.send_message("ERROR", message="room is served by another worker")
+            await self.close()
+            return
+        # board or moves sent below include every diff broadcast before
+        self.version = self.actor.round
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+
+        self.session = save_session(
+            slug,
+            self.scope["player"],
+            self.scope,
+            self.actor.round,
+            session.token if session else None,
+        )
+
+        online = await self.presence.touch(
+            self.scope["room"].id, self.scope["player"], self.channel_name
+        )
+        self.scope["opponent_channel"] = online.get(self.scope["opponent"])
+        self.scope["opponent_online"] = self._notified_online = bool(
+            self.scope["opponent_channel"]
+        )
+        self._heartbeat = asyncio.create_task(self.heartbeat())
+
+        await self.send_message(
+            "INFO",
+            opponent_score=self.scope["opponent_score"],
+            opponent_deck=self.scope["opponent_deck"],
+            opponent_online=self.scope["opponent_online"],
+            first=self.scope["first"],
+            state=self.scope["state_message"],
+            round=self.scope["state_round"],
+            session=self.session,
+        )
+        await self.broadcast(
+            "presence_info",
+            exclude=self.scope["player"],
+            channel=self.channel_name,
+        )
+
+        # load and send board, reconnected client gets only missed moves
+        seq = query.get("seq")
+        if seq and seq[0].isdigit():
+            await self.send_moves(int(seq[0]))
+        elif session:
+            await self.send_moves(session.version)
+        else:
             await self.send_board()
 
-    @sync_to_async
-    def get_state(self):
-        state = self.scope["player_in_room"].get_state()
-        return state.message, state.round
+    async def resume(self, slug: str, session: RoomSession):
+        self.room_name = slug
+        self.room_group_name = f"room_{slug}"
+        self.scope.update(session.context)
 
     @sync_to_async
     def connect_to_room(self):
@@ -249,68 +328,81 @@ class RoomConsumer(BaseConsumer):
 
         self.room_name = slug
         self.room_group_name = f"room_{slug}"
-        room = Room.objects.filter(slug=slug)
 
-        if not room:
+        # players of room are cached, only their state is read
+        snapshot = get_room_snapshot(slug)
+        if not snapshot:
             return False
 
-        self.scope["room"] = room.first()
-
         # check if player can be in a room
-        p_ids = [x.player.id for x in room.first().players.all()]
-        if self.scope["player"] not in p_ids:
+        player = snapshot.seat(self.scope["player"])
+        opponent = snapshot.opponent(self.scope["player"])
+        if not player or not opponent:
             return False
 
-        # add player info to scope
-        player = PlayerInRoom.objects.get(player_id=self.scope["player"])
+        states = get_seat_states(snapshot)
+        if player.id not in states or opponent.id not in states:
+            # room was closed after snapshot was taken
+            room_snapshots.pop(slug)
+            return False
 
+        # add player info to scope
+        self.scope["room"] = snapshot.room
         self.scope["player_in_room"] = player
         self.scope["first"] = player.first
+        self.scope["first_player"] = player.id if player.first else opponent.id
         self.scope["score"] = player.score
-        self.scope["deck"] = player.deck.id
-        self.scope["state"] = room.first().states.last().round
-
-        p_ids.remove(player.player.id)
-        opponent = PlayerInRoom.objects.get(player_id=p_ids[0])
+        self.scope["deck"] = player.deck_id
+        self.scope["state_message"] = states[player.id].message
+        self.scope["state_round"] = states[player.id].round
 
-        self.scope["opponent"] = opponent.player.id
-        self.scope["opponent_channel"] = opponent.channel_name
+        self.scope["opponent"] = opponent.player_id
         self.scope["opponent_score"] = opponent.score
-        self.scope["opponent_deck"] = opponent.deck.id
+        self.scope["opponent_deck"] = opponent.deck_id
         self.scope["opponent_first"] = opponent.first
-        self.scope["opponent_online"] = opponent.online
-
-        player.online = True
-        player.channel_name = self.channel_name
-        player.save(update_fields=["online", "channel_name"])
         return True
 
     async def disconnect(self, close_code):
         # Leave room group
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
-        await self.disconnect_player()
-
-        if "opponent_channel" in self.scope and self.scope["opponent_channel"]:
-            await self.channel_layer.send(
-                self.scope["opponent_channel"],
-                {"type": "connection_info", "online": False},
+        if self.actor:
+            for task in [self._heartbeat, self._notify]:
+                if task:
+                    task.cancel()
+            await self.presence.leave(
+                self.scope["room"].id, self.scope["player"], self.channel_name
+            )
+            await self.broadcast(
+                "presence_info",
+                exclude=self.scope["player"],
+                channel=None,
+                left=self.channel_name,
             )
 
-    @sync_to_async
-    def disconnect_player(self):
-        if "player_in_room" in self.scope:
-            self.scope["player_in_room"].online = False
-            self.scope["player_in_room"].channel_name = None
-            self.scope["player_in_room"].save(update_fields=["online", "channel_name"])
+            # room context is kept for ROOM_SESSION_TTL to resume session
+            save_session(
+                self.room_name,
+                self.scope["player"],
+                self.scope,
+                self.actor.round,
+                self.session,
+            )
+            await self.actor.leave()
+
+    async def heartbeat(self):
+        # keeps player online and notices opponents that went away without leaving
+        while True:
+            await asyncio.sleep(settings.ROOM_PRESENCE_HEARTBEAT)
+            online = await self.presence.touch(
+                self.scope["room"].id, self.scope["player"], self.channel_name
+            )
+            channel = online.get(self.scope["opponent"])
+            if channel != self.scope["opponent_channel"]:
+                await self.presence_changed(channel)
 
     # Receive message from WebSocket
-    async def receive(self, text_data):
-        data = None
-
-        try:
-            data = json.loads(text_data)
-        except ValueError:
-            await self.send_message("ERROR", message="data is not JSON serializable")
+    async def receive(self, text_data=None, bytes_data=None):
+        data = await self.read_message(text_data, bytes_data)
 
         if data:
             if "type" not in data:
@@ -318,79 +410,96 @@ class RoomConsumer(BaseConsumer):
             elif data["type"] == "start":
                 if not await self.start(data):
                     await self.send_message("ERROR", message="opponent is offline")
+            elif data["type"] == "resync":
+                await self.send_board()
+            elif data["type"] == "sync":
+                try:
+                    seq = int(data.get("seq", 0))
+                except (TypeError, ValueError):
+                    await self.send_message("ERROR", message="seq is incorrect")
+                else:
+                    await self.send_moves(seq)
             elif data["type"] == "move":
                 if all(x in data for x in ["x", "y", "px", "py"]):
-                    await self.perform_move(data)
+                    try:
+                        data.update({x: int(data[x]) for x in ["x", "y", "px", "py"]})
+                    except (TypeError, ValueError):
+                        await self.send_message(
+                            "ERROR", message="coordinates are incorrect"
+                        )
+                    else:
+                        await self.perform_move(data)
             else:
                 await self.send_message("ERROR", message="incorrect data typing")
 
     async def start(self, data):
-        if self.scope["opponent_channel"] and self.scope["opponent_online"]:
-            await self.channel_layer.send(
-                self.scope["opponent_channel"],
-                {
-                    "type": "info",
-                    "message": "opponent is ready to start",
-                },
+        if self.scope["opponent_online"]:
+            await self.broadcast(
+                "info",
+                exclude=self.scope["player"],
+                message="opponent is ready to start",
             )
             return True
         return False
 
     async def perform_move(self, data):
-        if await move_handler(
-            data["px"],
-            data["py"],
-            data["x"],
-            data["y"],
-            self.room_name,
-            self.scope["player_in_room"],
-        ):
-            await self.send_board()
-        if self.scope["opponent_channel"] and self.scope["opponent_online"]:
-            await self.channel_layer.send(
-                self.scope["opponent_channel"],
-                {
-                    "type": "move",
-                    "x": data["x"],
-                    "y": data["y"],
-                    "px": data["px"],
-                    "py": data["py"],
-                },
+        try:
+            result = await self.actor.submit_move(
+                self.scope["player_in_room"],
+                data["px"],
+                data["py"],
+                data["x"],
+                data["y"],
             )
-            return True
-        return False
+        except RoomOwnedElsewhere:
+            # room was taken over, client reconnects to its new owner
+            await self.send_message("ERROR", message="room is served by another worker")
+            await self.close()
+            return False
+        if not result:
+            await self.send_message("ERROR", message="move is incorrect")
+            return False
 
-    @sync_to_async
-    def load_board(self):
-        # loads bord from db to scope
-        room = self.scope["room"]
-        board = [
-            [None, None, None, None, None, None, None, None],
-            [None, None, None, None, None, None, None, None],
-            [None, None, None, None, None, None, None, None],
-            [None, None, None, None, None, None, None, None],
-            [None, None, None, None, None, None, None, None],
-            [None, None, None, None, None, None, None, None],
-            [None, None, None, None, None, None, None, None],
-            [None, None, None, None, None, None, None, None],
-        ]
-        for el in room.heroes.all():
-            board[el.y - 1][el.x - 1] = [el.hero.type, el.health]
-
-        self.scope["board"] = board
+        version, changes = result
+        # player's own connections get the diff from the group too
+        await self.broadcast("board_diff", version=version, changes=changes)
+        return True
+
+    async def broadcast(self, message_type: str, exclude: int | None = None, **data):
+        """sends event to all room's connections, connections of exclude player skip it"""
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {"type": message_type, "exclude": exclude, **data},
+        )
+
+    def accept_broadcast(self, event) -> bool:
+        """False if event should be skipped by this connection"""
+        # events sent directly to channel have no exclude
+        return event.get("exclude") != self.scope["player"]
 
     async def send_board(self):
-        # sends board to client
+        # sends full board snapshot to client, diffs are sent after it
+        self.version = self.actor.round
         await self.send_message(
-            "INFO",
-            message=f"game's board for round {self.scope['state']}",
-            board=self.scope["board"],
+            "BOARD",
+            version=self.version,
+            board=self.actor.board.to_list(),
         )
 
+    async def send_moves(self, seq: int):
+        # sends moves made after seq to client
+        moves = await self.actor.moves_since(seq)
+        # moves made while these were read come as diffs
+        last = moves[-1][0] if moves else min(seq, self.actor.round)
+        self.version = max(self.version, last)
+        await self.send_message("MOVES", moves=moves, round=self.actor.round)
+
     # info type group message handler
     async def info(self, event):
-        message = event["message"]
-        msg = {"type": "INFO", "message": message}
+        if not self.accept_broadcast(event):
+            return
+
+        msg = {"message": event["message"]}
 
         if "opponent_score" in event:
             msg["opponent_score"] = event["opponent_score"]
@@ -410,44 +519,121 @@ class RoomConsumer(BaseConsumer):
         if "round" in event:
             msg["round"] = event["round"]
 
-        await self.send(text_data=json.dumps(msg))
+        await self.send_message("INFO", **msg)
 
-    async def channel(self, event):
-        channel = event["channel"]
-        self.scope["opponent_channel"] = channel
+    # opponent's presence message handler, channel is None when opponent left
+    async def presence_info(self, event):
+        if not self.accept_broadcast(event):
+            return
 
-    async def connection_info(self, event):
-        status = event["online"]
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "INFO",
-                    "message": "opponent is online"
-                    if status
-                    else "opponent is offline",
-                }
-            )
-        )
-        self.scope["opponent_online"] = status
-
-    async def move(self, event):
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "MOVE",
-                    "x": event["x"],
-                    "y": event["y"],
-                    "px": event["px"],
-                    "py": event["py"],
-                }
+        # opponent can be back on new channel before old one is closed
+        if "left" in event and event["left"] != self.scope["opponent_channel"]:
+            return
+        await self.presence_changed(event["channel"])
+
+    async def presence_changed(self, channel: str | None):
+        self.scope["opponent_channel"] = channel
+        self.scope["opponent_online"] = bool(channel)
+        # flapping connection results in one message after it settles
+        if not self._notify or self._notify.done():
+            self._notify = asyncio.create_task(self.notify_presence())
+
+    async def notify_presence(self):
+        await asyncio.sleep(settings.ROOM_PRESENCE_NOTIFY_DELAY)
+        if self.scope["opponent_online"] != self._notified_online:
+            self._notified_online = self.scope["opponent_online"]
+            await self.send_message(
+                "INFO",
+                message=(
+                    "opponent is online"
+                    if self._notified_online
+                    else "opponent is offline"
+                ),
             )
+
+    async def board_diff(self, event):
+        # only diffs are ordered, missed ones are covered by full board
+        if event["version"] <= self.version:
+            return
+        if event["version"] > self.version + 1:
+            # diff came before previous one or channel layer dropped it
+            await self.send_board()
+            return
+
+        self.version = event["version"]
+        await self.send_message(
+            "BOARD_DIFF", version=event["version"], changes=event["changes"]
         )
 
     async def check_origin(self):
         if not self.scope["player"]:
-            await self.send(
-                text_data=json.dumps(
-                    {"type": "ERROR", "message": "token is incorrect or expired"}
-                )
-            )
+            await self.send_message("ERROR", message="token is incorrect or expired")
             await self.close()
+
+
+class SpectatorConsumer(BaseConsumer):
+    """
+    read-only connection to room, served from room's feed in process:
+    spectators share encoded frames and don't join room's group
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.feed = None
+        self.spectator = None
+        self.acked = 0  # board version client confirmed
+        self._forward = None
+
+    async def connect(self):
+        await self.accept()
+
+        snapshot = await sync_to_async(get_room_snapshot)(
+            self.scope["url_route"]["kwargs"]["room_name"]
+        )
+        if not snapshot:
+            await self.close()
+            return
+
+        self.feed = await join_feed(snapshot.room)
+        # subscribed at the board's version, so diffs continue it without gaps
+        self.spectator = self.feed.hub.subscribe(self.codec, self.feed.version)
+        self.acked = self.feed.version
+        board = self.feed.board_frame(self.codec)
+        self._forward = asyncio.create_task(self.forward())
+        await self.send_frame(board)
+
+    async def forward(self):
+        hub = self.feed.hub
+        while (frames := await hub.next_frames(self.spectator)) is not None:
+            for version, frame in frames:
+                # send doesn't wait for the socket, so client's acks bound
+                # frames that can be buffered for it
+                if version - self.acked > settings.ROOM_SPECTATOR_BUFFER:
+                    await self.close(code=1013)
+                    return
+                await self.send_frame(frame)
+        # connection is too slow to keep up with the room
+        await self.close(code=1013)
+
+    async def disconnect(self, close_code):
+        if self.feed:
+            self.feed.hub.unsubscribe(self.spectator)
+            if self._forward:
+                self._forward.cancel()
+            await self.feed.leave()
+            self.feed = None
+
+    async def receive(self, text_data=None, bytes_data=None):
+        data = await self.read_message(text_data, bytes_data)
+        if not data:
+            return
+
+        if data.get("type") != "ack":
+            await self.send_message("ERROR", message="spectators can only send ack")
+            return
+        try:
+            version = int(data.get("version"))
+        except (TypeError, ValueError):
+            await self.send_message("ERROR", message="version is incorrect")
+        else:
+            self.acked = max(self.acked, min(version, self.spectator.version))
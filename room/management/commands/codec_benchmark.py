@@ -0,0 +1,50 @@
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from room.services.codecs import CODECS, PIECE_TYPES
+
+
+def _sample_messages() -> dict:
+    board = [[None] * 8 for _ in range(8)]
+    for y in [0, 1, 6, 7]:
+        for x in range(8):
+            board[y][x] = [random.choice(PIECE_TYPES), random.randint(1, 10)]
+
+    return {
+        "move": {"type": "move", "px": 1, "py": 2, "x": 1, "y": 3},
+        "board diff": {
+            "type": "BOARD_DIFF",
+            "version": 12,
+            "changes": [[1, 2, None], [1, 3, ["WARRIOR", 7]]],
+        },
+        "board": {"type": "BOARD", "version": 12, "board": board},
+        "info": {
+            "type": "INFO",
+            "message": "user found, with score 312",
+            "room": "a1B2c3D4e5F6g7H8",
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = "Measures encode/decode cost of websocket messages for every codec"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-n", "--number", type=int, default=100000)
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        self.stdout.write(
+            f"{'codec':<10}{'message':<12}{'size, B':>9}{'encode, us':>12}{'decode, us':>12}"
+        )
+        for name, codec in CODECS.items():
+            for message_name, message in _sample_messages().items():
+                data = codec.encode(message)
+                encode = timeit.timeit(lambda: codec.encode(message), number=number)
+                decode = timeit.timeit(lambda: codec.decode(data), number=number)
+                self.stdout.write(
+                    f"{name:<10}{message_name:<12}{len(data):>9}"
+                    f"{encode / number * 1e6:>12.2f}{decode / number * 1e6:>12.2f}"
+                )
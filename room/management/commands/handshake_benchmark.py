@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from channels.db import database_sync_to_async
+from django.core.management.base import BaseCommand
+
+from game.services.jwt import sign_jwt, verified_tokens
+from room.middleware import HeaderAuthMiddleware, get_player
+
+
+async def _app(scope, receive, send):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Authenticates many concurrent websocket handshakes and prints timings"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-n", "--connections", type=int, default=5000)
+        parser.add_argument(
+            "-p", "--players", type=int, default=500, help="distinct tokens"
+        )
+
+    async def _storm(self, scopes: list[dict], on_loop: bool) -> float:
+        middleware = HeaderAuthMiddleware(_app)
+        # previous middleware ran token check in thread pool for every handshake
+        in_pool = database_sync_to_async(get_player)
+
+        async def handshake(scope):
+            if on_loop:
+                await middleware(scope, None, None)
+            else:
+                scope["player"] = await in_pool(dict(scope["headers"]))
+
+        start = time.perf_counter()
+        await asyncio.gather(*[handshake(scope) for scope in scopes])
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        tokens = [
+            sign_jwt({"id": i, "type": "access"}).encode()
+            for i in range(options["players"])
+        ]
+        scopes = [
+            {"headers": [(b"authorization", tokens[i % len(tokens)])]}
+            for i in range(options["connections"])
+        ]
+
+        for name, on_loop, cached in [
+            ("thread pool", False, False),
+            ("event loop, cold cache", True, False),
+            ("event loop, warm cache", True, True),
+        ]:
+            if not cached:
+                verified_tokens.clear()
+            else:
+                asyncio.run(self._storm(scopes, on_loop))
+
+            spent = asyncio.run(self._storm(scopes, on_loop))
+            self.stdout.write(
+                f"{name:<24}{len(scopes)} handshakes in {spent * 1000:.1f} ms, "
+                f"{spent / len(scopes) * 1e6:.1f} us each"
+            )
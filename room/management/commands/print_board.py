@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from common.debug import render_board
+from room.models import Room
+from room.services.board import Board
+from room.services.replay import replay_board
+
+
+class Command(BaseCommand):
+    help = "Prints current board of the room or the board after given move"
+
+    def add_arguments(self, parser):
+        parser.add_argument("slug", type=str)
+        parser.add_argument(
+            "--until", type=int, help="replays saved moves up to this seq"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            room = Room.objects.get(slug=options["slug"])
+        except Room.DoesNotExist:
+            raise CommandError(f"room with slug {options['slug']} doesn't exist")
+
+        if options["until"] is None:
+            board = Board.load(room)
+        else:
+            board = replay_board(room, options["until"])
+        self.stdout.write(render_board(board))
@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from room.routing import websocket_urlpatterns
+from room.services.codecs import CODECS
+from room.services.room_join import get_room_snapshot
+from room.services.spectators import join_feed
+
+
+class Command(BaseCommand):
+    help = "Watches room with hundreds of spectators, sends moves and prints timings"
+
+    def add_arguments(self, parser):
+        parser.add_argument("room", help="room slug")
+        parser.add_argument("-n", "--spectators", type=int, default=500)
+        parser.add_argument("-m", "--moves", type=int, default=200)
+        parser.add_argument(
+            "-s", "--slow", type=int, default=50, help="spectators that never ack"
+        )
+        parser.add_argument(
+            "-i", "--interval", type=float, default=0.01, help="seconds between moves"
+        )
+        parser.add_argument("-c", "--codec", choices=list(CODECS), default="json")
+
+    async def _watch(self, client, received: dict, ack: bool, last: int) -> bool:
+        """reads frames up to last version, True if server closed connection"""
+        codec = CODECS[self.options["codec"]]
+        while True:
+            output = await client.receive_output(timeout=10)
+            if output["type"] == "websocket.close":
+                return True
+
+            message = codec.decode(output.get("text") or output.get("bytes"))
+            received.setdefault(message["version"], []).append(time.perf_counter())
+            if message["version"] >= last:
+                return False
+            if not ack:
+                continue
+            frame = codec.encode({"type": "ack", "version": message["version"]})
+            if codec.binary:
+                await client.send_to(bytes_data=frame)
+            else:
+                await client.send_to(text_data=frame)
+
+    async def _run(self):
+        options = self.options
+        snapshot = await sync_to_async(get_room_snapshot)(options["room"])
+        if not snapshot:
+            raise CommandError(f"room {options['room']} doesn't exist")
+        application = URLRouter(websocket_urlpatterns)
+
+        clients = [
+            WebsocketCommunicator(
+                application,
+                f"/room/{options['room']}/watch",
+                subprotocols=[options["codec"]],
+            )
+            for _ in range(options["spectators"] + options["slow"])
+        ]
+        start = time.perf_counter()
+        await asyncio.gather(*[x.connect() for x in clients])
+        await asyncio.gather(*[x.receive_output() for x in clients])
+        spent = time.perf_counter() - start
+        self.stdout.write(
+            f"{len(clients)} spectators connected in {spent * 1000:.1f} ms"
+        )
+
+        feed = await join_feed(snapshot.room)
+        last = feed.version + options["moves"]
+        received = {}
+        watching = [
+            asyncio.create_task(
+                self._watch(x, received, i < options["spectators"], last)
+            )
+            for i, x in enumerate(clients)
+        ]
+
+        # moves are broadcast to room's group the way RoomConsumer does
+        sent = {}
+        layer = get_channel_layer()
+        for version in range(feed.version + 1, last + 1):
+            sent[version] = time.perf_counter()
+            await layer.group_send(
+                feed.group,
+                {
+                    "type": "board_diff",
+                    "version": version,
+                    "changes": [[1, 2, None], [1, 3, ["WARRIOR", 3]]],
+                    "exclude": None,
+                },
+            )
+            await asyncio.sleep(options["interval"])
+        closed = await asyncio.gather(*watching)
+
+        delays = sorted(
+            max(received[version]) - at
+            for version, at in sent.items()
+            if version in received
+        )
+        frames = sum(len(x) for x in received.values())
+        self.stdout.write(
+            f"{options['moves']} moves: {frames} frames delivered, "
+            f"{feed.hub.encoded} encoded, last spectator got move in "
+            f"{delays[len(delays) // 2] * 1000:.1f} ms median, "
+            f"{delays[-1] * 1000:.1f} ms max"
+        )
+        self.stdout.write(
+            f"{sum(closed[options['spectators']:])} of {options['slow']} spectators "
+            f"without acks dropped, {sum(closed[:options['spectators']])} of "
+            f"{options['spectators']} others"
+        )
+        await asyncio.gather(*[x.disconnect() for x in clients])
+        await feed.leave()
+
+    def handle(self, *args, **options):
+        self.options = options
+        # fake moves shouldn't reach real players of the room, so they are
+        # sent through in-process channel layer
+        with override_settings(
+            CHANNEL_LAYERS={
+                "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+            }
+        ):
+            asyncio.run(self._run())
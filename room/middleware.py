@@ -1,18 +1,18 @@
-from channels.db import database_sync_to_async
-from django.core.exceptions import PermissionDenied
+from jwt import InvalidTokenError
 
-from game.models import Player
 from game.services.jwt import read_jwt
 
 
-@database_sync_to_async
 def get_player(headers):
     # WARNING headers type is bytes
     if b"authorization" not in headers or not headers[b"authorization"]:
         return False
 
     jwt = headers[b"authorization"].decode()
-    payload = read_jwt(jwt)
+    try:
+        payload = read_jwt(jwt)
+    except InvalidTokenError:
+        return False
 
     if not payload or "id" not in payload:
         return False
@@ -28,6 +28,7 @@ class HeaderAuthMiddleware:
         self.app = app
 
     async def __call__(self, scope, receive, send):
-        scope["player"] = await get_player(dict(scope["headers"]))
+        # token check doesn't touch db, so it's done right on event loop
+        scope["player"] = get_player(dict(scope["headers"]))
 
         return await self.app(scope, receive, send)
@@ -5,17 +5,6 @@ from django.db import models
 from game.models import Player, Deck, Hero
 
 
-class PlayerInQueue(models.Model):
-    # TODO use redis for storing
-    player = models.OneToOneField(Player, unique=True, on_delete=models.CASCADE)
-    channel_name = models.CharField(max_length=50, blank=False)
-    deck = models.ForeignKey(Deck, on_delete=models.CASCADE)
-    score = models.IntegerField()
-
-    def __str__(self):
-        return f"{self.player.name} in que with score {self.score}"
-
-
 class Room(models.Model):
     slug = models.SlugField(max_length=16, unique=True)
     created = models.DateTimeField(auto_now_add=True)
@@ -31,8 +20,6 @@ class PlayerInRoom(models.Model):
     first = models.BooleanField()
     score = models.IntegerField(blank=False)
     deck = models.ForeignKey(Deck, on_delete=models.CASCADE, related_name="decks")
-    online = models.BooleanField(default=False)
-    channel_name = models.CharField(max_length=50, blank=True, null=True)
 
     def get_state(self):
         return GameState.objects.filter(player=self.player, room=self.room).last()
@@ -66,6 +53,14 @@ class HeroInGame(models.Model):
     health = models.IntegerField(blank=False)
     dead = models.BooleanField(default=False)
 
+    # placement on game start, used to replay moves
+    start_x = models.IntegerField(
+        blank=False, validators=[MinValueValidator(1), MaxValueValidator(8)]
+    )
+    start_y = models.IntegerField(
+        blank=False, validators=[MinValueValidator(1), MaxValueValidator(8)]
+    )
+
     def __str__(self):
         return f"{self.hero.type} in room {self.room.slug}"
 
@@ -74,8 +69,23 @@ class HeroInGame(models.Model):
     ):
         if not self.health and not self.dead:
             self.health = self.hero.health
+        if not self.start_x and not self.start_y:
+            self.start_x, self.start_y = self.x, self.y
 
         super().save(force_insert, force_update, using, update_fields)
 
     class Meta:
         unique_together = ["x", "y", "hero"]
+
+
+class RoomMove(models.Model):
+    """append-only log of room's moves, seq is the round move was made on"""
+
+    room = models.ForeignKey(Room, related_name="moves", on_delete=models.CASCADE)
+    seq = models.IntegerField(blank=False)
+    # encoded with room.services.replay.encode_move
+    move = models.PositiveSmallIntegerField(blank=False)
+
+    class Meta:
+        unique_together = ["room", "seq"]
+        ordering = ["seq"]
@@ -5,4 +5,5 @@ from . import consumers
 websocket_urlpatterns = [
     path("room/", consumers.QueueConsumer.as_asgi()),
     path("room/<str:room_name>", consumers.RoomConsumer.as_asgi()),
+    path("room/<str:room_name>/watch", consumers.SpectatorConsumer.as_asgi()),
 ]
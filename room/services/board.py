@@ -0,0 +1,121 @@
+from room.models import HeroInGame, Room
+
+BOARD_SIZE = 8
+
+
+class Piece:
+    """hero on board, owner is PlayerInRoom id"""
+
+    __slots__ = ("id", "type", "owner", "first", "health")
+
+    def __init__(self, id: int, type: str, owner: int, first: bool, health: int):
+        self.id = id
+        self.type = type
+        self.owner = owner
+        self.first = first
+        self.health = health
+
+    def __repr__(self):
+        return f"<Piece {self.type} {self.id}>"
+
+
+class Board:
+    """
+    in-memory 8x8 board of room's heroes, coordinates are counted from 1
+    the same way as on HeroInGame
+    """
+
+    def __init__(self):
+        self.squares: list[Piece | None] = [None] * BOARD_SIZE * BOARD_SIZE
+
+    @staticmethod
+    def _index(x: int, y: int) -> int:
+        return (y - 1) * BOARD_SIZE + x - 1
+
+    @staticmethod
+    def on_board(x: int, y: int) -> bool:
+        return 1 <= x <= BOARD_SIZE and 1 <= y <= BOARD_SIZE
+
+    @classmethod
+    def load(cls, room: Room, initial: bool = False) -> "Board":
+        """loads current board of room or board it was started with"""
+        board = cls()
+        heroes = HeroInGame.objects.filter(room=room)
+        if initial:
+            x_field, y_field, health_field = "start_x", "start_y", "hero__health"
+        else:
+            heroes = heroes.filter(dead=False)
+            x_field, y_field, health_field = "x", "y", "health"
+
+        heroes = heroes.values_list(
+            "id",
+            x_field,
+            y_field,
+            "hero__type",
+            "player_id",
+            "player__first",
+            health_field,
+        )
+        for id, x, y, type, owner, first, health in heroes:
+            board.place(Piece(id, type, owner, first, health), x, y)
+        return board
+
+    def get(self, x: int, y: int) -> Piece | None:
+        return self.squares[self._index(x, y)]
+
+    def place(self, piece: Piece | None, x: int, y: int):
+        self.squares[self._index(x, y)] = piece
+
+    def path_is_clear(self, prev_x: int, prev_y: int, x: int, y: int) -> bool:
+        """checks squares between two on the same line or diagonal to be empty"""
+        step_x = (x > prev_x) - (x < prev_x)
+        step_y = (y > prev_y) - (y < prev_y)
+        c_x, c_y = prev_x + step_x, prev_y + step_y
+        while (c_x, c_y) != (x, y):
+            if self.get(c_x, c_y):
+                return False
+            c_x += step_x
+            c_y += step_y
+        return True
+
+    def validate_move(self, prev_x: int, prev_y: int, x: int, y: int) -> bool:
+        if not self.on_board(prev_x, prev_y) or not self.on_board(x, y):
+            return False
+        if (x, y) == (prev_x, prev_y):
+            return False
+
+        piece = self.get(prev_x, prev_y)
+        if not piece or self.get(x, y):
+            return False
+
+        d_x, d_y = x - prev_x, y - prev_y
+        if piece.type == "KING":
+            return abs(d_x) <= 1 and abs(d_y) <= 1
+        elif piece.type == "WIZARD":
+            if abs(d_x) == abs(d_y) or d_x == 0 or d_y == 0:
+                return self.path_is_clear(prev_x, prev_y, x, y)
+        elif piece.type == "ARCHER":
+            if abs(d_x) == abs(d_y):
+                return self.path_is_clear(prev_x, prev_y, x, y)
+        elif piece.type == "WARRIOR":
+            # warriors go only forward, first player's side is at y = 1
+            return d_y == (1 if piece.first else -1) and abs(d_x) <= 1
+        return False
+
+    def move(self, prev_x: int, prev_y: int, x: int, y: int) -> Piece:
+        piece = self.get(prev_x, prev_y)
+        self.place(None, prev_x, prev_y)
+        self.place(piece, x, y)
+        return piece
+
+    def cell(self, x: int, y: int) -> list | None:
+        """square as sent to clients, [type, health] or None"""
+        piece = self.get(x, y)
+        return [piece.type, piece.health] if piece else None
+
+    def to_list(self) -> list:
+        """board as rows of cells"""
+        return [
+            [self.cell(x, y) for x in range(1, BOARD_SIZE + 1)]
+            for y in range(1, BOARD_SIZE + 1)
+        ]
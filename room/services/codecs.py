@@ -0,0 +1,132 @@
+import struct
+
+import msgpack
+import orjson
+
+PIECE_TYPES = ["KING", "WIZARD", "ARCHER", "WARRIOR"]
+PIECE_CODES = {type: code for code, type in enumerate(PIECE_TYPES, start=1)}
+
+
+class JsonCodec:
+    name = "json"
+    binary = False
+
+    def encode(self, message: dict) -> str:
+        return orjson.dumps(message).decode()
+
+    def decode(self, data: str | bytes) -> dict:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError as e:
+            raise ValueError(e)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message: dict) -> bytes:
+        return msgpack.packb(message)
+
+    def decode(self, data: str | bytes) -> dict:
+        if isinstance(data, str):
+            raise ValueError("binary frame is expected")
+        try:
+            return msgpack.unpackb(data)
+        except Exception as e:
+            raise ValueError(e)
+
+
+class PackedCodec(MsgpackCodec):
+    """
+    moves and boards are packed in fixed layouts, the first byte of frame
+    is its kind, other messages are sent as msgpack
+    """
+
+    name = "packed"
+
+    OTHER, MOVE, BOARD, BOARD_DIFF = range(4)
+
+    # px, py, x, y
+    move_struct = struct.Struct(">B4B")
+    # version, amount of squares
+    board_struct = struct.Struct(">BIB")
+    # x, y, piece type (0 for empty), health, follows board header for every square
+    square_struct = struct.Struct(">4B")
+
+    def _pack_squares(self, kind: int, version: int, squares: list) -> bytes:
+        values = []
+        for x, y, cell in squares:
+            if cell:
+                values += (x, y, PIECE_CODES[cell[0]], cell[1])
+            else:
+                values += (x, y, 0, 0)
+        return self.board_struct.pack(kind, version, len(squares)) + bytes(values)
+
+    def _unpack_squares(self, data: bytes) -> tuple[int, list]:
+        _, version, count = self.board_struct.unpack_from(data)
+        values = data[self.board_struct.size :]
+        if len(values) != count * self.square_struct.size:
+            raise ValueError("frame is truncated")
+
+        squares = []
+        for i in range(0, len(values), self.square_struct.size):
+            x, y, type, health = values[i : i + self.square_struct.size]
+            if not (1 <= x <= 8 and 1 <= y <= 8 and type <= len(PIECE_TYPES)):
+                raise ValueError("square is out of range")
+            squares.append([x, y, [PIECE_TYPES[type - 1], health] if type else None])
+        return version, squares
+
+    def encode(self, message: dict) -> bytes:
+        if message["type"] == "move":
+            return self.move_struct.pack(
+                self.MOVE, message["px"], message["py"], message["x"], message["y"]
+            )
+        elif message["type"] == "BOARD_DIFF":
+            return self._pack_squares(
+                self.BOARD_DIFF, message["version"], message["changes"]
+            )
+        elif message["type"] == "BOARD":
+            # only occupied squares are sent
+            squares = [
+                [x, y, cell]
+                for y, row in enumerate(message["board"], start=1)
+                for x, cell in enumerate(row, start=1)
+                if cell
+            ]
+            return self._pack_squares(self.BOARD, message["version"], squares)
+        return bytes([self.OTHER]) + super().encode(message)
+
+    def decode(self, data: str | bytes) -> dict:
+        if isinstance(data, str) or not data:
+            raise ValueError("binary frame is expected")
+
+        try:
+            if data[0] == self.MOVE:
+                _, px, py, x, y = self.move_struct.unpack(data)
+                return {"type": "move", "px": px, "py": py, "x": x, "y": y}
+            elif data[0] == self.BOARD_DIFF:
+                version, changes = self._unpack_squares(data)
+                return {"type": "BOARD_DIFF", "version": version, "changes": changes}
+            elif data[0] == self.BOARD:
+                version, squares = self._unpack_squares(data)
+                board = [[None] * 8 for _ in range(8)]
+                for x, y, cell in squares:
+                    board[y - 1][x - 1] = cell
+                return {"type": "BOARD", "version": version, "board": board}
+        except struct.error as e:
+            raise ValueError(e)
+        if data[0] != self.OTHER:
+            raise ValueError("unknown frame kind")
+        return super().decode(data[1:])
+
+
+CODECS = {codec.name: codec for codec in [JsonCodec(), MsgpackCodec(), PackedCodec()]}
+
+
+def negotiate_codec(subprotocols: list[str]):
+    """first of client's websocket subprotocols that is supported, json by default"""
+    for name in subprotocols:
+        if name in CODECS:
+            return CODECS[name]
+    return CODECS["json"]
@@ -1,110 +1,35 @@
-from asgiref.sync import sync_to_async
-from termcolor import colored
+import logging
 
-from room.models import HeroInGame, Room, PlayerInRoom
+from django.conf import settings
 
+from common.debug import render_board
+from room.services.board import Board, Piece
 
-def _check_path(f_x: int, f_y: int, x: int, y: int, room: Room, move_type: str):
-    if move_type == "DIAGONAL":
-        return (
-            HeroInGame.objects.filter(
-                room=room, x__range=(f_x, x), y__range=(f_y, y)
-            ).count()
-            == 0
-        )
-    elif move_type == "HORIZONTAL":
-        return HeroInGame.objects.filter(room=room, x=x, y__range=(f_y, y)).count() == 0
-    elif move_type == "VERTICAL":
-        return HeroInGame.objects.filter(room=room, x__range=(f_x, x), y=y).count() == 0
-    return False
-
-
-def _validate_hero_movement(
-    hero_type: str,
-    prev_x: int,
-    prev_y: int,
-    x: int,
-    y: int,
-    room: Room,
-    first: bool = False,  # needed for warrior
-):
-    if hero_type == "KING":
-        if abs(x - prev_x) > 1 or abs(y - prev_y) > 1:
-            return False
-    elif hero_type == "WIZARD":
-        if abs(x - prev_x) == abs(y - prev_y):
-            return _check_path(prev_x, prev_y, x, y, room, "DIAGONAL")
-        elif x == prev_x and y != prev_y:
-            return _check_path(prev_x, prev_y, x, y, room, "HORIZONTAL")
-        elif x != prev_x and y == prev_y:
-            return _check_path(prev_x, prev_y, x, y, room, "VERTICAL")
-        return False
-    elif hero_type == "ARCHER":
-        if abs(x - prev_x) == abs(y - prev_y):
-            return _check_path(prev_x, prev_y, x, y, room, "DIAGONAL")
-        return False
-    elif hero_type == "WARRIOR":
-        if first:
-            if x == prev_x and y - prev_y == 1:
-                return True
-            elif abs(x - prev_x) == 1 and y - prev_y == 1:
-                return True
-        else:
-            if x == prev_x and prev_y - y == 1:
-                return True
-    return False
+logger = logging.getLogger(__name__)
 
 
-def _print_board(room: Room):
-    for y in range(1, 9):
-        for x in range(1, 9):
-            try:
-                hero = HeroInGame.objects.get(x=x, y=y, room=room)
-                if hero.hero.type == "KING":
-                    if hero.player.first:
-                        print(colored("♔", 'green', attrs=['bold']), end="")
-                    else:
-                        print(colored("♚", 'red', attrs=['bold']), end="")
-                elif hero.hero.type == "WIZARD":
-                    if hero.player.first:
-                        print(colored("♕", 'green', attrs=['bold']), end="")
-                    else:
-                        print(colored("♛", 'red', attrs=['bold']), end="")
-                elif hero.hero.type == "ARCHER":
-                    if hero.player.first:
-                        print(colored("♗", 'green', attrs=['bold']), end="")
-                    else:
-                        print(colored("♝", 'red', attrs=['bold']), end="")
-                else:
-                    if hero.player.first:
-                        print(colored("♙", 'green', attrs=['bold']), end="")
-                    else:
-                        print(colored("♟", 'red', attrs=['bold']), end="")
-            except HeroInGame.DoesNotExist:
-                print("*", end="")
-        print()
+def check_move(
+    board: Board, player_id: int, prev_x: int, prev_y: int, x: int, y: int
+) -> Piece | None:
+    """validates move of player's hero, returns hero to be moved"""
+    if not board.on_board(prev_x, prev_y):
+        return None
 
+    piece = board.get(prev_x, prev_y)
+    if not piece or piece.owner != player_id:
+        return None
 
-@sync_to_async
-def move_handler(
-    prev_x: int, prev_y: int, x: int, y: int, room_slug: str, player: PlayerInRoom
-):
-    room = Room.objects.get(slug=room_slug)
-    _print_board(room)  # TODO: Remove in production
-    try:
-        hero = HeroInGame.objects.get(x=prev_x, y=prev_y, room=room, player=player)
-    except HeroInGame.DoesNotExist:
-        return False
+    if not board.validate_move(prev_x, prev_y, x, y):
+        return None
+    return piece
 
-    if x == prev_x and y == prev_y:
-        return False
 
-    h_t = hero.hero.type
-
-    if _validate_hero_movement(h_t, prev_x, prev_y, x, y, room, first=player.first):
-        hero.x = x
-        hero.y = y
-        hero.save(update_fields=["x", "y"])
-        return True
-
-    _print_board(room)  # TODO: Remove in production
+def make_move(board: Board, prev_x: int, prev_y: int, x: int, y: int) -> Piece:
+    """makes already validated move"""
+    piece = board.move(prev_x, prev_y, x, y)
+    if settings.ROOM_BOARD_TRACE:
+        logger.debug(
+            f"board after move from {prev_x} {prev_y} to {x} {y}:\n"
+            f"{render_board(board)}"
+        )
+    return piece
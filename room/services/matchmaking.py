@@ -0,0 +1,136 @@
+import bisect
+import threading
+import time
+from typing import NamedTuple
+
+SCORE_TOLERANCE = 0.05
+# window widens by TOLERANCE_GROWTH for every TOLERANCE_STEP seconds of waiting
+TOLERANCE_GROWTH = 0.01
+TOLERANCE_STEP = 10
+MAX_SCORE_TOLERANCE = 0.25
+
+
+class QueueEntry(NamedTuple):
+    player_id: int
+    channel_name: str
+    deck_id: int
+    score: int
+    joined: float
+
+
+def score_window(score: int, tolerance: float = SCORE_TOLERANCE) -> tuple:
+    return score * (1 - tolerance), score * (1 + tolerance)
+
+
+def wait_tolerance(waited: float) -> float:
+    return min(
+        SCORE_TOLERANCE + TOLERANCE_GROWTH * (waited // TOLERANCE_STEP),
+        MAX_SCORE_TOLERANCE,
+    )
+
+
+def pair_entries(entries: list[QueueEntry], now: float | None = None) -> list:
+    """greedily pairs neighbours of the queue sorted by score"""
+    now = now or time.time()
+    entries = sorted(entries, key=lambda e: e.score)
+    pairs = []
+
+    i = 0
+    while i < len(entries) - 1:
+        low, high = entries[i], entries[i + 1]
+        # the longest awaiting player sets the window
+        tolerance = wait_tolerance(now - min(low.joined, high.joined))
+        if high.score <= score_window(low.score, tolerance)[1]:
+            pairs.append((low, high))
+            i += 2
+        else:
+            i += 1
+    return pairs
+
+
+class ScoreIndex:
+    """players awaiting in queue, kept sorted by score for range lookups"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []  # sorted (score, player_id) pairs
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, player_id):
+        return player_id in self._entries
+
+    def _remove(self, player_id: int) -> QueueEntry | None:
+        entry = self._entries.pop(player_id, None)
+        if entry:
+            key = (entry.score, entry.player_id)
+            del self._keys[bisect.bisect_left(self._keys, key)]
+        return entry
+
+    def add(
+        self,
+        player_id: int,
+        channel_name: str,
+        deck_id: int,
+        score: int,
+        joined: float | None = None,
+    ) -> QueueEntry:
+        entry = QueueEntry(
+            player_id, channel_name, deck_id, score, joined or time.time()
+        )
+        with self._lock:
+            self._remove(player_id)
+            self._entries[player_id] = entry
+            bisect.insort(self._keys, (score, player_id))
+        return entry
+
+    def discard(self, player_id: int) -> QueueEntry | None:
+        with self._lock:
+            return self._remove(player_id)
+
+    def get(self, player_id: int) -> QueueEntry | None:
+        return self._entries.get(player_id)
+
+    def entries(self) -> list[QueueEntry]:
+        """snapshot of the queue ordered by score"""
+        with self._lock:
+            return [self._entries[p_id] for _, p_id in self._keys]
+
+    def claim_pair(self, player_id_1: int, player_id_2: int) -> bool:
+        """removes both players from the queue if both are still awaiting"""
+        with self._lock:
+            if player_id_1 not in self._entries or player_id_2 not in self._entries:
+                return False
+            self._remove(player_id_1)
+            self._remove(player_id_2)
+            return True
+
+    def claim_nearest(
+        self, player_id: int, score: int, tolerance: float = SCORE_TOLERANCE
+    ) -> QueueEntry | None:
+        """
+        finds opponent with the closest score in window and removes both players
+        from the queue, so opponent can't be claimed twice
+        """
+        s_min, s_max = score_window(score, tolerance)
+        with self._lock:
+            pos = bisect.bisect_left(self._keys, (score,))
+            best = None
+
+            # closest score is the first neighbour of the position on either side
+            for step, i in ((-1, pos - 1), (1, pos)):
+                while 0 <= i < len(self._keys) and self._keys[i][1] == player_id:
+                    i += step
+                if 0 <= i < len(self._keys) and s_min <= self._keys[i][0] <= s_max:
+                    if best is None or abs(self._keys[i][0] - score) < abs(
+                        best[0] - score
+                    ):
+                        best = self._keys[i]
+
+            if not best:
+                return None
+
+            self._remove(player_id)
+            return self._remove(best[1])
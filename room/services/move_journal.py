@@ -0,0 +1,126 @@
+import json
+import time
+from functools import lru_cache
+
+import redis.asyncio
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class BaseMoveJournal:
+    """append-only log of room's moves that are not saved to db yet"""
+
+    async def append(self, room_id: int, move: dict):
+        raise NotImplementedError
+
+    async def pending(self, room_id: int) -> list[dict]:
+        """moves in order of appending"""
+        raise NotImplementedError
+
+    async def trim(self, room_id: int, count: int):
+        """drops first count moves, after they were saved"""
+        raise NotImplementedError
+
+    async def acquire(self, room_id: int, owner: str, ttl: float) -> bool:
+        """
+        takes or extends room's lease for ttl seconds, only lease owner
+        writes room's moves, False if room is owned by another one
+        """
+        raise NotImplementedError
+
+    async def release(self, room_id: int, owner: str):
+        raise NotImplementedError
+
+
+class MemoryMoveJournal(BaseMoveJournal):
+    """in-process journal for tests, doesn't survive restart"""
+
+    def __init__(self, **options):
+        self.moves = {}
+        self.owners = {}
+
+    async def append(self, room_id, move):
+        self.moves.setdefault(room_id, []).append(move)
+
+    async def pending(self, room_id):
+        return list(self.moves.get(room_id, []))
+
+    async def trim(self, room_id, count):
+        del self.moves.get(room_id, [])[:count]
+
+    async def acquire(self, room_id, owner, ttl):
+        current, expires = self.owners.get(room_id, (None, 0))
+        if current not in (None, owner) and expires > time.time():
+            return False
+        self.owners[room_id] = (owner, time.time() + ttl)
+        return True
+
+    async def release(self, room_id, owner):
+        if self.owners.get(room_id, (None,))[0] == owner:
+            del self.owners[room_id]
+
+
+class RedisMoveJournal(BaseMoveJournal):
+    """journal stored in redis list per room, lease is a key next to it"""
+
+    # KEYS: lease; ARGV: owner, ttl in ms
+    ACQUIRE_SCRIPT = """
+    local current = redis.call('GET', KEYS[1])
+    if current and current ~= ARGV[1] then
+        return 0
+    end
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+    """
+
+    # KEYS: lease; ARGV: owner
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", prefix: str = "journal"):
+        self.client = redis.asyncio.Redis.from_url(url)
+        self.prefix = prefix
+        self._acquire = self.client.register_script(self.ACQUIRE_SCRIPT)
+        self._release = self.client.register_script(self.RELEASE_SCRIPT)
+
+    def _key(self, room_id: int) -> str:
+        return f"{self.prefix}:{room_id}"
+
+    async def append(self, room_id, move):
+        await self.client.rpush(self._key(room_id), json.dumps(move))
+
+    async def pending(self, room_id):
+        return [
+            json.loads(x) for x in await self.client.lrange(self._key(room_id), 0, -1)
+        ]
+
+    async def trim(self, room_id, count):
+        await self.client.ltrim(self._key(room_id), count, -1)
+
+    async def acquire(self, room_id, owner, ttl):
+        return bool(
+            await self._acquire(
+                keys=[f"{self._key(room_id)}:owner"], args=[owner, int(ttl * 1000)]
+            )
+        )
+
+    async def release(self, room_id, owner):
+        await self._release(keys=[f"{self._key(room_id)}:owner"], args=[owner])
+
+
+@lru_cache(maxsize=None)
+def get_move_journal() -> BaseMoveJournal:
+    config = settings.ROOM_MOVE_JOURNAL
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+@receiver(setting_changed)
+def reset_move_journal(setting, **kwargs):
+    if setting == "ROOM_MOVE_JOURNAL":
+        get_move_journal.cache_clear()
@@ -0,0 +1,123 @@
+import time
+from functools import lru_cache
+
+import redis.asyncio
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class BasePresenceBackend:
+    """
+    channels of players connected to rooms, player is online while
+    heartbeats come more often than ttl seconds
+    """
+
+    def __init__(self, ttl: float = 30):
+        self.ttl = ttl
+
+    async def touch(self, room_id: int, player_id: int, channel_name: str) -> dict:
+        """marks player online on channel, returns channels of online players"""
+        raise NotImplementedError
+
+    async def leave(self, room_id: int, player_id: int, channel_name: str):
+        """marks player offline, unless player is already back on another channel"""
+        raise NotImplementedError
+
+    async def online(self, room_id: int) -> dict[int, str]:
+        raise NotImplementedError
+
+
+class MemoryPresenceBackend(BasePresenceBackend):
+    """in-process presence for tests and single process setups"""
+
+    def __init__(self, ttl: float = 30, **options):
+        super().__init__(ttl)
+        self.rooms = {}
+
+    async def touch(self, room_id, player_id, channel_name):
+        self.rooms.setdefault(room_id, {})[player_id] = (channel_name, time.time())
+        return await self.online(room_id)
+
+    async def leave(self, room_id, player_id, channel_name):
+        players = self.rooms.get(room_id, {})
+        if players.get(player_id, (None,))[0] == channel_name:
+            del players[player_id]
+            if not players:
+                del self.rooms[room_id]
+
+    async def online(self, room_id):
+        expired = time.time() - self.ttl
+        return {
+            player_id: channel_name
+            for player_id, (channel_name, seen) in self.rooms.get(room_id, {}).items()
+            if seen > expired
+        }
+
+
+class RedisPresenceBackend(BasePresenceBackend):
+    """
+    presence shared between workers, stored in hash per room with
+    "<last heartbeat> <channel>" values keyed by player id
+    """
+
+    # KEYS: room; ARGV: player id, channel
+    LEAVE_SCRIPT = """
+    local value = redis.call('HGET', KEYS[1], ARGV[1])
+    if value and string.sub(value, string.find(value, ' ') + 1) == ARGV[2] then
+        return redis.call('HDEL', KEYS[1], ARGV[1])
+    end
+    return 0
+    """
+
+    def __init__(
+        self,
+        url: str = "redis://127.0.0.1:6379/0",
+        prefix: str = "presence",
+        ttl: float = 30,
+    ):
+        super().__init__(ttl)
+        self.client = redis.asyncio.Redis.from_url(url)
+        self.prefix = prefix
+        self._leave = self.client.register_script(self.LEAVE_SCRIPT)
+
+    def _key(self, room_id: int) -> str:
+        return f"{self.prefix}:{room_id}"
+
+    def _load(self, players: dict) -> dict[int, str]:
+        expired = time.time() - self.ttl
+        online = {}
+        for player_id, value in players.items():
+            seen, channel_name = value.decode().split(" ", 1)
+            if float(seen) > expired:
+                online[int(player_id)] = channel_name
+        return online
+
+    async def touch(self, room_id, player_id, channel_name):
+        key = self._key(room_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, player_id, f"{time.time()} {channel_name}")
+            # rooms nobody sends heartbeats to are dropped
+            pipe.expire(key, int(self.ttl * 2))
+            pipe.hgetall(key)
+            *_, players = await pipe.execute()
+        return self._load(players)
+
+    async def leave(self, room_id, player_id, channel_name):
+        await self._leave(keys=[self._key(room_id)], args=[player_id, channel_name])
+
+    async def online(self, room_id):
+        return self._load(await self.client.hgetall(self._key(room_id)))
+
+
+@lru_cache(maxsize=None)
+def get_presence_backend() -> BasePresenceBackend:
+    config = settings.ROOM_PRESENCE_BACKEND
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+@receiver(setting_changed)
+def reset_presence_backend(setting, **kwargs):
+    if setting == "ROOM_PRESENCE_BACKEND":
+        get_presence_backend.cache_clear()
@@ -0,0 +1,199 @@
+import json
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from room.services.matchmaking import (
+    SCORE_TOLERANCE,
+    QueueEntry,
+    ScoreIndex,
+    score_window,
+)
+
+
+class BaseQueueBackend:
+    """storage for players awaiting opponent"""
+
+    def add(
+        self,
+        player_id: int,
+        channel_name: str,
+        deck_id: int,
+        score: int,
+        joined: float | None = None,
+    ) -> QueueEntry:
+        """adds player to queue, joined is kept for players put back to it"""
+        raise NotImplementedError
+
+    def discard(self, player_id: int) -> QueueEntry | None:
+        raise NotImplementedError
+
+    def get(self, player_id: int) -> QueueEntry | None:
+        raise NotImplementedError
+
+    def entries(self) -> list[QueueEntry]:
+        """snapshot of the queue ordered by score"""
+        raise NotImplementedError
+
+    def claim_nearest(
+        self, player_id: int, score: int, tolerance: float = SCORE_TOLERANCE
+    ) -> QueueEntry | None:
+        """atomically removes player and the closest opponent in window from queue"""
+        raise NotImplementedError
+
+    def claim_pair(self, player_id_1: int, player_id_2: int) -> bool:
+        """atomically removes both players from queue if both are still awaiting"""
+        raise NotImplementedError
+
+
+class MemoryQueueBackend(BaseQueueBackend):
+    """in-process queue, for tests and single worker setups"""
+
+    def __init__(self, **options):
+        self.index = ScoreIndex()
+
+    def add(self, player_id, channel_name, deck_id, score, joined=None):
+        return self.index.add(player_id, channel_name, deck_id, score, joined)
+
+    def discard(self, player_id):
+        return self.index.discard(player_id)
+
+    def get(self, player_id):
+        return self.index.get(player_id)
+
+    def entries(self):
+        return self.index.entries()
+
+    def claim_nearest(self, player_id, score, tolerance=SCORE_TOLERANCE):
+        return self.index.claim_nearest(player_id, score, tolerance)
+
+    def claim_pair(self, player_id_1, player_id_2):
+        return self.index.claim_pair(player_id_1, player_id_2)
+
+
+class RedisQueueBackend(BaseQueueBackend):
+    """
+    queue shared between workers, scores are stored in sorted set and
+    entries in hash, both keyed by player id
+    """
+
+    # KEYS: scores, entries; ARGV: player id, score, min score, max score
+    CLAIM_SCRIPT = """
+    local player = ARGV[1]
+    local score = tonumber(ARGV[2])
+    local below = redis.call('ZREVRANGEBYSCORE', KEYS[1], ARGV[2], ARGV[3], 'WITHSCORES', 'LIMIT', 0, 2)
+    local above = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[2], ARGV[4], 'WITHSCORES', 'LIMIT', 0, 2)
+    local best, best_diff
+    for _, side in ipairs({below, above}) do
+        for i = 1, #side, 2 do
+            if side[i] ~= player then
+                local diff = math.abs(tonumber(side[i + 1]) - score)
+                if not best or diff < best_diff then
+                    best, best_diff = side[i], diff
+                end
+                break
+            end
+        end
+    end
+    if not best then
+        return nil
+    end
+    local entry = redis.call('HGET', KEYS[2], best)
+    redis.call('ZREM', KEYS[1], player, best)
+    redis.call('HDEL', KEYS[2], player, best)
+    return entry
+    """
+
+    # KEYS: scores, entries; ARGV: player id
+    DISCARD_SCRIPT = """
+    local entry = redis.call('HGET', KEYS[2], ARGV[1])
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    return entry
+    """
+
+    # KEYS: scores, entries; ARGV: player ids
+    CLAIM_PAIR_SCRIPT = """
+    if redis.call('HEXISTS', KEYS[2], ARGV[1]) == 0 or redis.call('HEXISTS', KEYS[2], ARGV[2]) == 0 then
+        return 0
+    end
+    redis.call('ZREM', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('HDEL', KEYS[2], ARGV[1], ARGV[2])
+    return 1
+    """
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", prefix: str = "queue"):
+        self.client = redis.Redis.from_url(url)
+        self.scores_key = f"{prefix}:scores"
+        self.entries_key = f"{prefix}:entries"
+        self._claim = self.client.register_script(self.CLAIM_SCRIPT)
+        self._discard = self.client.register_script(self.DISCARD_SCRIPT)
+        self._claim_pair = self.client.register_script(self.CLAIM_PAIR_SCRIPT)
+
+    @staticmethod
+    def _load(raw: bytes | None) -> QueueEntry | None:
+        if not raw:
+            return None
+        return QueueEntry(*json.loads(raw))
+
+    def add(self, player_id, channel_name, deck_id, score, joined=None):
+        entry = QueueEntry(
+            player_id, channel_name, deck_id, score, joined or time.time()
+        )
+        with self.client.pipeline() as pipe:
+            pipe.hset(self.entries_key, player_id, json.dumps(entry))
+            pipe.zadd(self.scores_key, {player_id: score})
+            pipe.execute()
+        return entry
+
+    def discard(self, player_id):
+        return self._load(
+            self._discard(keys=[self.scores_key, self.entries_key], args=[player_id])
+        )
+
+    def get(self, player_id):
+        return self._load(self.client.hget(self.entries_key, player_id))
+
+    def entries(self):
+        p_ids = self.client.zrange(self.scores_key, 0, -1)
+        if not p_ids:
+            return []
+        return [
+            entry
+            for entry in map(self._load, self.client.hmget(self.entries_key, p_ids))
+            if entry
+        ]
+
+    def claim_nearest(self, player_id, score, tolerance=SCORE_TOLERANCE):
+        s_min, s_max = score_window(score, tolerance)
+        return self._load(
+            self._claim(
+                keys=[self.scores_key, self.entries_key],
+                args=[player_id, score, s_min, s_max],
+            )
+        )
+
+    def claim_pair(self, player_id_1, player_id_2):
+        return bool(
+            self._claim_pair(
+                keys=[self.scores_key, self.entries_key],
+                args=[player_id_1, player_id_2],
+            )
+        )
+
+
+@lru_cache(maxsize=None)
+def get_queue_backend() -> BaseQueueBackend:
+    config = settings.ROOM_QUEUE_BACKEND
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+@receiver(setting_changed)
+def reset_queue_backend(setting, **kwargs):
+    if setting == "ROOM_QUEUE_BACKEND":
+        get_queue_backend.cache_clear()
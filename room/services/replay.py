@@ -0,0 +1,38 @@
+from room.models import Room, RoomMove
+from room.services.board import Board
+
+
+def encode_move(prev_x: int, prev_y: int, x: int, y: int) -> int:
+    """packs move into 12 bits, 3 bits per coordinate"""
+    return (prev_x - 1) << 9 | (prev_y - 1) << 6 | (x - 1) << 3 | (y - 1)
+
+
+def decode_move(move: int) -> tuple[int, int, int, int]:
+    return (
+        (move >> 9 & 7) + 1,
+        (move >> 6 & 7) + 1,
+        (move >> 3 & 7) + 1,
+        (move & 7) + 1,
+    )
+
+
+def get_moves(room: Room, since: int = 0) -> list[tuple[int, int, int, int, int]]:
+    """saved moves of room made after seq since as (seq, px, py, x, y)"""
+    return [
+        (seq, *decode_move(move))
+        for seq, move in RoomMove.objects.filter(room=room, seq__gt=since).values_list(
+            "seq", "move"
+        )
+    ]
+
+
+def replay_board(room: Room, until: int | None = None) -> Board:
+    """rebuilds board of room as it was after move with seq until"""
+    board = Board.load(room, initial=True)
+    moves = RoomMove.objects.filter(room=room)
+    if until is not None:
+        moves = moves.filter(seq__lte=until)
+
+    for move in moves.values_list("move", flat=True):
+        board.move(*decode_move(move))
+    return board
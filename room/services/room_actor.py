@@ -0,0 +1,193 @@
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db.models import Max
+
+from room.models import Room
+from room.services.board import Board
+from room.services.game_logic import check_move, make_move
+from room.services.room_join import Seat
+from room.services.write_behind import MoveWriter, RoomOwnedElsewhere
+
+logger = logging.getLogger(__name__)
+
+
+class RoomActor:
+    """
+    single owner of room's game in process: keeps board, turn and round
+    in memory and applies moves one by one in order of arrival
+    """
+
+    def __init__(
+        self,
+        room: Room,
+        board: Board,
+        round: int,
+        first_player: int,
+        writer: MoveWriter,
+    ):
+        self.room = room
+        self.board = board
+        self.round = round
+        self.first_player = first_player  # PlayerInRoom id
+        self.writer = writer
+        self.connections = 0
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def turn(self) -> bool:
+        """True if it's first player's turn"""
+        return self.round % 2 == 0
+
+    async def submit_move(
+        self, player: Seat, prev_x: int, prev_y: int, x: int, y: int
+    ) -> tuple[int, list] | None:
+        """board version after move and changed squares, None if move is incorrect"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((player, prev_x, prev_y, x, y, future))
+        return await future
+
+    async def moves_since(self, seq: int) -> list[tuple[int, int, int, int, int]]:
+        return await self.writer.moves_since(seq)
+
+    @classmethod
+    async def load(cls, room: Room, first_player: int) -> "RoomActor":
+        board, round = await load_board(room)
+        writer = MoveWriter(room)
+        try:
+            moves = await writer.recover(round)
+        except Exception:
+            await writer.close()
+            raise
+
+        for move in moves:
+            board.move(move["px"], move["py"], move["x"], move["y"])
+            round = move["round"]
+        return cls(room, board, round, first_player, writer)
+
+    async def _run(self):
+        while (command := await self._queue.get()) is not None:
+            *move, future = command
+            try:
+                result = await self._move(*move)
+            except RoomOwnedElsewhere as e:
+                result, error = None, e
+            except Exception as e:
+                logger.exception(f"failed to make move in room {self.room.slug}")
+                result, error = None, e
+            else:
+                error = None
+
+            # consumer that submitted move could disconnect and cancel it
+            if future.done():
+                continue
+            if error:
+                # error is logged above, caller doesn't get actor's frames
+                future.set_exception(error.with_traceback(None))
+            else:
+                future.set_result(result)
+
+    async def _move(self, player, prev_x, prev_y, x, y) -> tuple[int, list] | None:
+        if self.writer.lost:
+            # room was taken over by another process, board here is stale,
+            # new connections load it again and reach the new owner
+            self._forget()
+            raise RoomOwnedElsewhere(f"room {self.room.slug} is owned elsewhere")
+        if (player.id == self.first_player) != self.turn:
+            return None
+
+        piece = check_move(self.board, player.id, prev_x, prev_y, x, y)
+        if not piece:
+            return None
+
+        # move is accepted once journaled, saving to db is done by writer,
+        # board isn't changed if journal fails or lease is lost
+        try:
+            await self.writer.record(
+                {
+                    "round": self.round + 1,
+                    "hero": piece.id,
+                    "player": player.player_id,
+                    "px": prev_x,
+                    "py": prev_y,
+                    "x": x,
+                    "y": y,
+                }
+            )
+        except RoomOwnedElsewhere:
+            self._forget()
+            raise
+        make_move(self.board, prev_x, prev_y, x, y)
+        self.round += 1
+        return self.round, [
+            [prev_x, prev_y, None],
+            [x, y, self.board.cell(x, y)],
+        ]
+
+    async def leave(self):
+        self.connections -= 1
+        if self.connections:
+            return
+
+        self._forget()
+        # room is loaded again only after already submitted moves are saved
+        closing = _closing[self.room.id] = asyncio.create_task(self._close())
+        await asyncio.shield(closing)
+
+    def _forget(self):
+        """removes actor from process' actors, if it's still there"""
+        loading = _actors.get(self.room.id)
+        if not loading or not loading.done() or loading.cancelled():
+            return
+        if not loading.exception() and loading.result() is self:
+            del _actors[self.room.id]
+
+    async def _close(self):
+        try:
+            await self._queue.put(None)
+            await self._task
+            await self.writer.close()
+        finally:
+            _closing.pop(self.room.id, None)
+
+
+# actors of process by room id, with ones that are being loaded
+_actors: dict[int, asyncio.Task] = {}
+# actors that are saving their moves after the last connection left
+_closing: dict[int, asyncio.Task] = {}
+
+
+@sync_to_async
+def load_board(room: Room) -> tuple[Board, int]:
+    """saved board of room and its round"""
+    board = Board.load(room)
+    round = room.states.aggregate(round=Max("round"))["round"] or 0
+    return board, round
+
+
+async def join_actor(room: Room, first_player: int) -> RoomActor:
+    """
+    room's actor, started on the first connection to the room in process,
+    raises RoomOwnedElsewhere if room is served by another process
+    """
+    while True:
+        # rooms are loaded and closed independently, nothing is locked process-wide
+        while closing := _closing.get(room.id):
+            await asyncio.wait([closing])
+
+        if room.id not in _actors:
+            _actors[room.id] = asyncio.create_task(RoomActor.load(room, first_player))
+        loading = _actors[room.id]
+        try:
+            actor = await asyncio.shield(loading)
+        except Exception:
+            if _actors.get(room.id) is loading:
+                del _actors[room.id]
+            raise
+
+        # actor could be closed by the time this connection got it
+        if _actors.get(room.id) is loading:
+            actor.connections += 1
+            return actor
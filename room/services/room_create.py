@@ -1,11 +1,73 @@
 from asgiref.sync import sync_to_async
+from django.db import transaction
 from random import randint
 
 from common.generators import generate_charset
-from game.models import Player, Deck
+from game.models import HeroInDeck
 from room.models import Room, PlayerInRoom, GameState, HeroInGame
 
 
+def sync_create_rooms(matches: list[dict]) -> list[str]:
+    """
+    creates room for each of matches (sync_create_room kwargs) in one transaction,
+    issues the same amount of queries for any number of rooms
+    """
+    with transaction.atomic():
+        rooms = Room.objects.bulk_create(
+            [Room(slug=generate_charset(16)) for _ in matches]
+        )
+
+        players = []
+        for room, match in zip(rooms, matches):
+            first_player = randint(1, 2)
+            for n in (1, 2):
+                players.append(
+                    PlayerInRoom(
+                        player_id=match[f"player_id_{n}"],
+                        room=room,
+                        score=match[f"player_score_{n}"],
+                        deck_id=match[f"deck_id_{n}"],
+                        first=first_player == n,
+                    )
+                )
+        players = PlayerInRoom.objects.bulk_create(players)
+
+        GameState.objects.bulk_create(
+            [
+                GameState(
+                    room=p.room, player_id=p.player_id, round=0, message="Game started"
+                )
+                for p in players
+            ]
+        )
+
+        decks = {}
+        for hero_in_deck in HeroInDeck.objects.filter(
+            deck_id__in=[p.deck_id for p in players]
+        ).select_related("hero"):
+            decks.setdefault(hero_in_deck.deck_id, []).append(hero_in_deck)
+
+        heroes = []
+        for p in players:
+            for hero_in_deck in decks.get(p.deck_id, []):
+                # second player's heroes are placed on the other side of the board
+                y = hero_in_deck.y if p.first else (8 if hero_in_deck.y == 1 else 7)
+                heroes.append(
+                    HeroInGame(
+                        hero=hero_in_deck.hero,
+                        player=p,
+                        room=p.room,
+                        x=hero_in_deck.x,
+                        y=y,
+                        start_x=hero_in_deck.x,
+                        start_y=y,
+                        health=hero_in_deck.hero.health,
+                    )
+                )
+        HeroInGame.objects.bulk_create(heroes)
+    return [room.slug for room in rooms]
+
+
 def sync_create_room(
     deck_id_1: int,
     player_id_1: int,
@@ -14,50 +76,18 @@ def sync_create_room(
     player_id_2: int,
     player_score_2: int,
 ):
-
-    room = Room.objects.create(slug=generate_charset(16))
-    player_1 = Player.objects.get(id=player_id_1)
-    player_2 = Player.objects.get(id=player_id_2)
-
-    first_player = randint(1, 2)
-
-    p1 = PlayerInRoom.objects.create(
-        player=player_1,
-        room=room,
-        score=player_score_1,
-        deck_id=deck_id_1,
-        first=first_player == 1,
-    )
-
-    p2 = PlayerInRoom.objects.create(
-        player=player_2,
-        room=room,
-        score=player_score_2,
-        deck_id=deck_id_2,
-        first=first_player == 2,
-    )
-    for p, d_id in [(p1, deck_id_1), (p2, deck_id_2)]:
-        GameState.objects.create(
-            room=room, player=p.player, round=0, message="Game started"
-        )
-        for hero_in_deck in Deck.objects.get(id=d_id).heroes():
-            if p.first:
-                HeroInGame.objects.create(
-                    hero=hero_in_deck.hero,
-                    player=p,
-                    room=room,
-                    x=hero_in_deck.x,
-                    y=hero_in_deck.y,
-                )
-            else:
-                HeroInGame.objects.create(
-                    hero=hero_in_deck.hero,
-                    player=p,
-                    room=room,
-                    x=hero_in_deck.x,
-                    y=8 if hero_in_deck.y == 1 else 7,
-                )
-    return room.slug
+    return sync_create_rooms(
+        [
+            {
+                "deck_id_1": deck_id_1,
+                "player_id_1": player_id_1,
+                "player_score_1": player_score_1,
+                "deck_id_2": deck_id_2,
+                "player_id_2": player_id_2,
+                "player_score_2": player_score_2,
+            }
+        ]
+    )[0]
 
 
 @sync_to_async
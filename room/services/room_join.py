@@ -0,0 +1,71 @@
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+
+from common.cache import TTLCache
+from room.models import GameState, PlayerInRoom, Room
+
+
+class Seat(NamedTuple):
+    """player's place in room, doesn't change while the game goes"""
+
+    id: int  # PlayerInRoom id
+    player_id: int
+    first: bool
+    score: int
+    deck_id: int
+
+
+class RoomSnapshot(NamedTuple):
+    room: Room
+    seats: tuple[Seat, ...]
+
+    def seat(self, player_id: int) -> Seat | None:
+        return next((x for x in self.seats if x.player_id == player_id), None)
+
+    def opponent(self, player_id: int) -> Seat | None:
+        return next((x for x in self.seats if x.player_id != player_id), None)
+
+
+class SeatState(NamedTuple):
+    message: str | None
+    round: int | None
+
+
+# snapshots by room slug, reused by reconnects to the room
+room_snapshots = TTLCache(
+    maxsize=settings.ROOM_SNAPSHOT_CACHE_SIZE, ttl=settings.ROOM_SNAPSHOT_CACHE_TTL
+)
+
+
+def get_room_snapshot(slug: str) -> RoomSnapshot | None:
+    """room with its players, loaded with one query and cached"""
+    if snapshot := room_snapshots.get(slug):
+        return snapshot
+
+    players = list(PlayerInRoom.objects.filter(room__slug=slug).select_related("room"))
+    if not players:
+        return None
+
+    snapshot = RoomSnapshot(
+        room=players[0].room,
+        seats=tuple(
+            Seat(x.id, x.player_id, x.first, x.score, x.deck_id) for x in players
+        ),
+    )
+    room_snapshots.set(slug, snapshot)
+    return snapshot
+
+
+def get_seat_states(snapshot: RoomSnapshot) -> dict[int, SeatState]:
+    """last game state of room's players by PlayerInRoom id"""
+    state = GameState.objects.filter(
+        room=OuterRef("room_id"), player=OuterRef("player_id")
+    ).order_by("-id")
+    players = PlayerInRoom.objects.filter(room_id=snapshot.room.id).values_list(
+        "id",
+        Subquery(state.values("message")[:1]),
+        Subquery(state.values("round")[:1]),
+    )
+    return {id: SeatState(*values) for id, *values in players}
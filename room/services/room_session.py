@@ -0,0 +1,58 @@
+import secrets
+from typing import NamedTuple
+
+from django.conf import settings
+
+from common.cache import TTLCache
+from common.generators import generate_charset
+
+# scope of room connection restored on resume
+SESSION_KEYS = (
+    "room",
+    "player_in_room",
+    "first",
+    "first_player",
+    "score",
+    "deck",
+    "state_message",
+    "state_round",
+    "opponent",
+    "opponent_score",
+    "opponent_deck",
+    "opponent_first",
+)
+
+
+class RoomSession(NamedTuple):
+    token: str
+    context: dict
+    version: int  # board version when player was last online
+
+
+# sessions by (room slug, player id), kept for ROOM_SESSION_TTL after disconnect
+room_sessions = TTLCache(
+    maxsize=settings.ROOM_SNAPSHOT_CACHE_SIZE, ttl=settings.ROOM_SESSION_TTL
+)
+
+
+def save_session(
+    slug: str,
+    player_id: int,
+    scope: dict,
+    version: int,
+    token: str | None = None,
+) -> str:
+    """stores player's room context, new token is generated if not given"""
+    token = token or generate_charset(32)
+    room_sessions.set(
+        (slug, player_id),
+        RoomSession(token, {x: scope[x] for x in SESSION_KEYS}, version),
+    )
+    return token
+
+
+def resume_session(slug: str, player_id: int, token: str) -> RoomSession | None:
+    session = room_sessions.get((slug, player_id))
+    if session and secrets.compare_digest(session.token, token):
+        return session
+    return None
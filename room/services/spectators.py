@@ -0,0 +1,196 @@
+import asyncio
+from collections import deque
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from room.models import Room
+from room.services.move_journal import get_move_journal
+from room.services.room_actor import load_board
+
+
+class Spectator:
+    __slots__ = ("codec", "position", "version")
+
+    def __init__(self, codec, position: int, version: int):
+        self.codec = codec
+        self.position = position  # messages of room already sent to spectator
+        self.version = version  # board version of the last of them
+
+
+class SpectatorHub:
+    """
+    room's messages for spectators connected to this process, kept in one
+    log shared by all of them: message is encoded once per codec and room
+    doesn't wait for spectators, ones falling behind the log are dropped
+    """
+
+    def __init__(self):
+        self.spectators: set[Spectator] = set()
+        self.published = 0
+        self.encoded = 0
+        # last messages with their frames by codec
+        self._log = deque(maxlen=settings.ROOM_SPECTATOR_BUFFER)
+        self._new = asyncio.Event()
+
+    def __len__(self):
+        return len(self.spectators)
+
+    def subscribe(self, codec, version: int) -> Spectator:
+        """spectator receives messages published after subscription"""
+        spectator = Spectator(codec, self.published, version)
+        self.spectators.add(spectator)
+        return spectator
+
+    def unsubscribe(self, spectator: Spectator):
+        self.spectators.discard(spectator)
+
+    def publish(self, message: dict):
+        self._log.append((message, {}))
+        self.published += 1
+        # spectators are woken after publisher is done with the message
+        new, self._new = self._new, asyncio.Event()
+        asyncio.get_running_loop().call_soon(new.set)
+
+    def behind(self, spectator: Spectator) -> bool:
+        """True if messages spectator hasn't got are already out of log"""
+        return self.published - spectator.position > len(self._log)
+
+    async def next_frames(
+        self, spectator: Spectator
+    ) -> list[tuple[int, str | bytes]] | None:
+        """
+        waits for messages spectator hasn't got, returns their board versions
+        with frames, None if spectator fell behind
+        """
+        while spectator.position == self.published:
+            await self._new.wait()
+        if self.behind(spectator):
+            self.unsubscribe(spectator)
+            return None
+
+        codec = spectator.codec
+        missed = self.published - spectator.position
+        frames = []
+        for i in range(len(self._log) - missed, len(self._log)):
+            message, encoded = self._log[i]
+            if codec.name not in encoded:
+                encoded[codec.name] = codec.encode(message)
+                self.encoded += 1
+            frames.append((message["version"], encoded[codec.name]))
+        spectator.position = self.published
+        spectator.version = frames[-1][0]
+        return frames
+
+
+class RoomFeed:
+    """
+    read-only board of room for its spectators in process, kept up to date
+    by diffs from room's group, so it works in any process and never
+    touches room's actor or its writer
+    """
+
+    def __init__(self, room: Room):
+        self.room = room
+        self.group = f"room_{room.slug}"
+        self.hub = SpectatorHub()
+        self.board = None  # rows of cells, as sent to clients
+        self.version = 0
+        self.spectators = 0
+        self._channel = None
+        self._task = None
+        self._boards = (None, {})  # board version and its frames by codec
+
+    @classmethod
+    async def start(cls, room: Room) -> "RoomFeed":
+        feed = cls(room)
+        layer = get_channel_layer()
+        feed._channel = await layer.new_channel()
+        # diffs broadcast while board is loaded are already in it or come after
+        await layer.group_add(feed.group, feed._channel)
+        try:
+            await feed.reload()
+        except Exception:
+            await layer.group_discard(feed.group, feed._channel)
+            raise
+        feed._task = asyncio.create_task(feed._run())
+        return feed
+
+    async def reload(self):
+        board, version = await load_board(self.room)
+        # moves that are journaled, but not saved yet
+        for move in await get_move_journal().pending(self.room.id):
+            if move["round"] > version:
+                board.move(move["px"], move["py"], move["x"], move["y"])
+                version = move["round"]
+        self.board, self.version = board.to_list(), version
+
+    def board_frame(self, codec) -> str | bytes:
+        """BOARD message, shared by spectators joined at the same version"""
+        if self._boards[0] != self.version:
+            self._boards = (self.version, {})
+        frames = self._boards[1]
+        if codec.name not in frames:
+            frames[codec.name] = codec.encode(
+                {"type": "BOARD", "version": self.version, "board": self.board}
+            )
+        return frames[codec.name]
+
+    async def _run(self):
+        layer = get_channel_layer()
+        while True:
+            event = await layer.receive(self._channel)
+            if event["type"] != "board_diff" or event["version"] <= self.version:
+                continue
+
+            if event["version"] > self.version + 1:
+                # diff was dropped by channel layer, spectators get full board
+                await self.reload()
+                board = [row[:] for row in self.board]
+                self.hub.publish(
+                    {"type": "BOARD", "version": self.version, "board": board}
+                )
+                continue
+
+            for x, y, cell in event["changes"]:
+                self.board[y - 1][x - 1] = cell
+            self.version = event["version"]
+            self.hub.publish(
+                {
+                    "type": "BOARD_DIFF",
+                    "version": self.version,
+                    "changes": event["changes"],
+                }
+            )
+
+    async def leave(self):
+        self.spectators -= 1
+        if self.spectators:
+            return
+
+        _feeds.pop(self.room.id, None)
+        self._task.cancel()
+        await get_channel_layer().group_discard(self.group, self._channel)
+
+
+# feeds of process by room id, with ones that are being loaded
+_feeds: dict[int, asyncio.Task] = {}
+
+
+async def join_feed(room: Room) -> RoomFeed:
+    """room's feed, started on the first spectator of the room in process"""
+    while True:
+        if room.id not in _feeds:
+            _feeds[room.id] = asyncio.create_task(RoomFeed.start(room))
+        loading = _feeds[room.id]
+        try:
+            feed = await asyncio.shield(loading)
+        except Exception:
+            if _feeds.get(room.id) is loading:
+                del _feeds[room.id]
+            raise
+
+        # feed could be stopped by the time this spectator got it
+        if _feeds.get(room.id) is loading:
+            feed.spectators += 1
+            return feed
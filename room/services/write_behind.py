@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from room.models import GameState, HeroInGame, Room, RoomMove
+from room.services.move_journal import get_move_journal
+from room.services.replay import encode_move, get_moves
+
+logger = logging.getLogger(__name__)
+
+# saved moves kept in memory, so reconnected players get them without db
+KEEP_SAVED_MOVES = 64
+
+
+class RoomOwnedElsewhere(Exception):
+    """room's moves are written by another process"""
+
+
+class MoveWriter:
+    """
+    saves room's moves to db in batches, every move is journaled first,
+    so moves that weren't saved before crash are replayed on next load
+    """
+
+    def __init__(self, room: Room):
+        self.room = room
+        self.journal = get_move_journal()
+        self.pending: list[dict] = []
+        self.saved = deque(maxlen=KEEP_SAVED_MOVES)
+        self.saved_round = 0
+        self.owner = uuid.uuid4().hex
+        self.lost = False  # room's lease was taken by another writer
+        self._owned = False
+        self._lease_until = 0
+        self._lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self._stopped = False
+        self._task = asyncio.create_task(self._run())
+
+    async def recover(self, saved_round: int) -> list[dict]:
+        """journaled moves made after saved_round, they are scheduled for saving"""
+        # two writers of the same room would save and trim its moves twice
+        self._owned = await self._renew()
+        if not self._owned:
+            raise RoomOwnedElsewhere(
+                f"room {self.room.slug} is owned by another writer"
+            )
+
+        moves = await self.journal.pending(self.room.id)
+        saved = [x for x in moves if x["round"] <= saved_round]
+        if saved:
+            # crashed after saving, but before trimming journal
+            await self.journal.trim(self.room.id, len(saved))
+
+        self.pending = [x for x in moves if x["round"] > saved_round]
+        self.saved_round = saved_round
+        return self.pending
+
+    async def _renew(self) -> bool:
+        until = time.monotonic() + settings.ROOM_OWNER_TTL
+        if not await self.journal.acquire(
+            self.room.id, self.owner, settings.ROOM_OWNER_TTL
+        ):
+            return False
+        self._lease_until = until
+        return True
+
+    def _lose(self):
+        logger.error(f"room {self.room.slug} was taken by another writer")
+        self.lost = True
+        self._owned = False
+
+    async def record(self, move: dict):
+        # journal is shared with the new owner once lease has expired
+        if not self.lost and time.monotonic() >= self._lease_until:
+            self._lose()
+        if self.lost:
+            raise RoomOwnedElsewhere(
+                f"room {self.room.slug} is owned by another writer"
+            )
+        await self.journal.append(self.room.id, move)
+        self.pending.append(move)
+        if len(self.pending) >= settings.ROOM_FLUSH_MOVES:
+            self._full.set()
+
+    async def flush(self):
+        async with self._lock:
+            # journal belongs to the new owner, its moves mustn't be trimmed
+            if self.lost:
+                return
+            moves, self.pending = self.pending, []
+            if not moves:
+                return
+
+            try:
+                await self._save(moves)
+            except BaseException:
+                # saving could be committed anyway, _save skips saved moves
+                self.pending = moves + self.pending
+                raise
+            self.saved.extend(moves)
+            self.saved_round = moves[-1]["round"]
+            await self.journal.trim(self.room.id, len(moves))
+
+    @sync_to_async
+    def _save(self, moves: list[dict]):
+        with transaction.atomic():
+            # moves saved before journal was trimmed are skipped
+            saved = set(
+                RoomMove.objects.filter(
+                    room=self.room, seq__in=[x["round"] for x in moves]
+                ).values_list("seq", flat=True)
+            )
+            moves = [x for x in moves if x["round"] not in saved]
+            if not moves:
+                return
+
+            positions = {}
+            for move in moves:
+                positions[move["hero"]] = (move["x"], move["y"])
+
+            HeroInGame.objects.bulk_update(
+                [HeroInGame(id=id, x=x, y=y) for id, (x, y) in positions.items()],
+                ["x", "y"],
+            )
+            RoomMove.objects.bulk_create(
+                [
+                    RoomMove(
+                        room=self.room,
+                        seq=move["round"],
+                        move=encode_move(move["px"], move["py"], move["x"], move["y"]),
+                    )
+                    for move in moves
+                ]
+            )
+            GameState.objects.bulk_create(
+                [
+                    GameState(
+                        room=self.room,
+                        player_id=move["player"],
+                        round=move["round"],
+                        message=f"moved from {move['px']} {move['py']} to {move['x']} {move['y']}",
+                    )
+                    for move in moves
+                ]
+            )
+
+    async def moves_since(self, seq: int) -> list[tuple[int, int, int, int, int]]:
+        """saved and pending moves after seq as (seq, px, py, x, y)"""
+        # pending moves can't be saved in between while flush is locked
+        async with self._lock:
+            kept = list(self.saved) + self.pending
+            first = kept[0]["round"] if kept else self.saved_round + 1
+
+            # only moves older than kept ones are read from db
+            moves = []
+            if seq + 1 < first:
+                moves = await sync_to_async(get_moves)(self.room, seq)
+            last = moves[-1][0] if moves else seq
+            return moves + [
+                (x["round"], x["px"], x["py"], x["x"], x["y"])
+                for x in kept
+                if x["round"] > last
+            ]
+
+    async def _run(self):
+        while not self._stopped and not self.lost:
+            try:
+                await asyncio.wait_for(self._full.wait(), settings.ROOM_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self._save_pending()
+
+    async def _save_pending(self):
+        try:
+            if self._owned and not await self._renew():
+                self._lose()
+                return
+            await self.flush()
+        except Exception:
+            # moves stay journaled and are saved by next flush or next load
+            logger.exception(f"failed to save moves of room {self.room.slug}")
+
+    async def close(self):
+        # loop isn't cancelled, save in progress would be interrupted
+        self._stopped = True
+        self._full.set()
+        await self._task
+        await self._save_pending()
+        if self._owned:
+            await self.journal.release(self.room.id, self.owner)
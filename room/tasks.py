@@ -1,3 +1,103 @@
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
 from celery import shared_task
+from channels.layers import get_channel_layer
+from django.db import IntegrityError
+
+from room.models import PlayerInRoom
+from room.services.matchmaking import QueueEntry, pair_entries
+from room.services.queue_backend import get_queue_backend
+from room.services.room_create import sync_create_rooms
+
+logger = logging.getLogger(__name__)
 
 # TODO: add timeout for state
+
+
+async def _notify_pairs(matches: list):
+    channel_layer = get_channel_layer()
+    await asyncio.gather(
+        *[
+            channel_layer.send(
+                player.channel_name,
+                {
+                    "type": "info",
+                    "message": f"user found, with score {opponent.score}",
+                    "room": room,
+                },
+            )
+            for room, first, second in matches
+            for player, opponent in [(first, second), (second, first)]
+        ]
+    )
+
+
+@shared_task(ignore_result=True)
+def match_queue():
+    """pairs the whole queue at once, runs periodically by celery beat"""
+    backend = get_queue_backend()
+
+    # players could have been matched on arrival or left since snapshot
+    pairs = [
+        (first, second)
+        for first, second in pair_entries(backend.entries())
+        if backend.claim_pair(first.player_id, second.player_id)
+    ]
+    if not pairs:
+        return
+
+    error = None
+    try:
+        rooms = sync_create_rooms([_match(first, second) for first, second in pairs])
+        matches = [(room, *pair) for room, pair in zip(rooms, pairs)]
+    except Exception:
+        # one bad pair fails the whole batch, so pairs are retried one by one
+        logger.exception("failed to create rooms for matched pairs")
+        matches, error = _create_rooms_by_pair(backend, pairs)
+
+    async_to_sync(_notify_pairs)(matches)
+    if error:
+        raise error
+
+
+def _match(first: QueueEntry, second: QueueEntry) -> dict:
+    return {
+        "deck_id_1": first.deck_id,
+        "player_id_1": first.player_id,
+        "player_score_1": first.score,
+        "deck_id_2": second.deck_id,
+        "player_id_2": second.player_id,
+        "player_score_2": second.score,
+    }
+
+
+def _create_rooms_by_pair(backend, pairs: list) -> tuple[list, Exception | None]:
+    """
+    rooms of pairs created one by one, players of failed pairs are put back
+    to queue with their waiting time, error is returned if any pair failed
+    not because of its players
+    """
+    matches, error = [], None
+    for pair in pairs:
+        try:
+            room = sync_create_rooms([_match(*pair)])[0]
+        except IntegrityError:
+            # player that got a room since joining queue can't be seated again
+            seated = set(
+                PlayerInRoom.objects.filter(
+                    player_id__in=[x.player_id for x in pair]
+                ).values_list("player_id", flat=True)
+            )
+            put_back = [x for x in pair if x.player_id not in seated]
+        except Exception as e:
+            put_back, error = pair, e
+        else:
+            matches.append((room, *pair))
+            continue
+
+        for entry in put_back:
+            backend.add(*entry)
+
+    return matches, error
@@ -1,3 +1,891 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import fakeredis.aioredis
+import jwt as pyjwt
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+
+from common.generators import generate_charset
+from game.models import Deck, Player
+from game.services.jwt import read_jwt, sign_jwt
+from game.tests import create_model_sets
+from chess_backend.asgi import application
+from room.consumers import RoomConsumer
+from room.services.board import BOARD_SIZE, Board, Piece
+from room.services.codecs import CODECS, negotiate_codec
+from room.services.game_logic import make_move
+from room.services.move_journal import get_move_journal
+from room.middleware import HeaderAuthMiddleware
+from room.models import HeroInGame, PlayerInRoom, Room
+from room.services.presence import (
+    BasePresenceBackend,
+    MemoryPresenceBackend,
+    RedisPresenceBackend,
+    get_presence_backend,
+)
+from room.services.queue_backend import get_queue_backend
+from room.services.replay import decode_move, encode_move, get_moves, replay_board
+from room.services.room_actor import _actors, join_actor
+from room.services.room_create import sync_create_room, sync_create_rooms
+from room.services.room_join import (
+    SeatState,
+    get_room_snapshot,
+    get_seat_states,
+    room_snapshots,
+)
+from room.services.write_behind import RoomOwnedElsewhere
+from room.tasks import match_queue
+
+MEMORY_BACKENDS = {
+    "CHANNEL_LAYERS": {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    "ROOM_MOVE_JOURNAL": {"BACKEND": "room.services.move_journal.MemoryMoveJournal"},
+    "ROOM_QUEUE_BACKEND": {"BACKEND": "room.services.queue_backend.MemoryQueueBackend"},
+    "ROOM_PRESENCE_BACKEND": {
+        "BACKEND": "room.services.presence.MemoryPresenceBackend"
+    },
+    "ROOM_FLUSH_INTERVAL": 0.1,
+}
+
+SQUARES = [(x, y) for y in range(1, BOARD_SIZE + 1) for x in range(1, BOARD_SIZE + 1)]
+
+
+@sync_to_async
+def count(queryset) -> int:
+    return queryset.count()
+
+
+def create_room() -> str:
+    create_model_sets()
+    players = [Player.objects.create(ton_wallet=generate_charset(48)) for _ in range(2)]
+    return sync_create_room(
+        players[0].get_last_deck().id,
+        players[0].id,
+        10,
+        players[1].get_last_deck().id,
+        players[1].id,
+        12,
+    )
+
+
+def clear_backends():
+    # room ids are reused by tests, state of previous rooms is dropped
+    get_move_journal().moves.clear()
+    get_move_journal().owners.clear()
+    get_presence_backend().rooms.clear()
+
+
+def find_move(board, owner: int) -> tuple[int, int, int, int]:
+    """any correct move of owner's hero as (px, py, x, y)"""
+    for px, py in SQUARES:
+        piece = board.get(px, py)
+        if piece and piece.owner == owner:
+            for x, y in SQUARES:
+                if board.validate_move(px, py, x, y):
+                    return px, py, x, y
+
+
+@override_settings(**MEMORY_BACKENDS)
+class QueueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_model_sets()
+        cls.players = [
+            Player.objects.create(ton_wallet=generate_charset(48)) for _ in range(3)
+        ]
+
+    def setUp(self):
+        self.backend = get_queue_backend()
+        for score, player in zip([100, 103, 300], self.players):
+            self.backend.add(
+                player.id, f"test.{player.id}", player.get_last_deck().id, score
+            )
+
+    def tearDown(self):
+        for player in self.players:
+            self.backend.discard(player.id)
+
+    def test_claim_pair(self):
+        first, second, third = [x.id for x in self.players]
+        self.assertTrue(self.backend.claim_pair(first, second))
+        self.assertIsNone(self.backend.get(first))
+        self.assertIsNone(self.backend.get(second))
+
+        # pair is claimed only while both players are still in queue
+        self.assertFalse(self.backend.claim_pair(first, third))
+        self.assertIsNotNone(self.backend.get(third))
+
+    def test_claim_nearest(self):
+        first, second, third = [x.id for x in self.players]
+        self.assertEqual(self.backend.claim_nearest(first, 100).player_id, second)
+        self.assertIsNone(self.backend.claim_nearest(third, 300))
+        # player without opponent stays in queue
+        self.assertIsNotNone(self.backend.get(third))
+
+    def test_match_queue(self):
+        match_queue()
+        rooms = PlayerInRoom.objects.filter(player__in=self.players[:2])
+        self.assertEqual(rooms.values("room").distinct().count(), 1)
+        self.assertEqual(
+            [x.player_id for x in self.backend.entries()], [self.players[2].id]
+        )
+
+    def test_match_queue_failure_requeues(self):
+        entries = self.backend.entries()
+        with mock.patch(
+            "room.tasks.sync_create_rooms", side_effect=ConnectionError
+        ), self.assertRaises(ConnectionError), self.assertLogs("room.tasks"):
+            match_queue()
+        # players keep the time they joined, so their window stays wide
+        self.assertEqual(self.backend.entries(), entries)
+
+    def test_seated_player_dropped_from_batch(self):
+        players = [
+            Player.objects.create(ton_wallet=generate_charset(48)) for _ in range(2)
+        ]
+        for player in players:
+            self.addCleanup(self.backend.discard, player.id)
+        # third player got a room after joining queue
+        sync_create_room(
+            self.players[2].get_last_deck().id,
+            self.players[2].id,
+            300,
+            players[0].get_last_deck().id,
+            players[0].id,
+            300,
+        )
+        entry = self.backend.add(
+            players[1].id, "test.late", players[1].get_last_deck().id, 305
+        )
+
+        with self.assertLogs("room.tasks"):
+            match_queue()
+        # the other pair isn't blocked by the bad one
+        rooms = PlayerInRoom.objects.filter(player__in=self.players[:2])
+        self.assertEqual(rooms.values("room").distinct().count(), 1)
+        self.assertEqual(self.backend.entries(), [entry])
+
+
+@override_settings(**MEMORY_BACKENDS)
+class QueueConsumerTest(TransactionTestCase):
+    def setUp(self):
+        create_model_sets()
+        self.players = [
+            Player.objects.create(ton_wallet=generate_charset(48)) for _ in range(2)
+        ]
+        # equal scores, so players are matched on arrival
+        Deck.objects.filter(player__in=self.players).update(total_score=100)
+
+    async def join_queue(self, player) -> WebsocketCommunicator:
+        client = WebsocketCommunicator(
+            application,
+            "/room/",
+            headers=[(b"authorization", player.get_access_token().encode())],
+        )
+        connected, _ = await client.connect()
+        self.assertTrue(connected)
+        deck = await sync_to_async(player.get_last_deck)()
+        await client.send_json_to({"type": "connect", "deck_id": deck.id})
+        return client
+
+    async def test_failed_room_requeues_players(self):
+        first = await self.join_queue(self.players[0])
+        await first.receive_json_from()
+        await first.receive_json_from()
+        joined = get_queue_backend().get(self.players[0].id).joined
+
+        with mock.patch(
+            "room.consumers.create_room", side_effect=ConnectionError
+        ), self.assertLogs("room.consumers", "ERROR"):
+            second = await self.join_queue(self.players[1])
+            await second.receive_json_from()
+            message = await second.receive_json_from()
+        self.assertEqual(message["type"], "ERROR")
+
+        backend = get_queue_backend()
+        self.assertEqual(backend.get(self.players[0].id).joined, joined)
+        self.assertIsNotNone(backend.get(self.players[1].id))
+        await first.disconnect()
+        await second.disconnect()
+
+
+class RoomCreateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_model_sets()
+        cls.players = [
+            Player.objects.create(ton_wallet=generate_charset(48)) for _ in range(6)
+        ]
+
+    def matches(self, rooms: int) -> list[dict]:
+        matches = []
+        for i in range(0, rooms * 2, 2):
+            first, second = self.players[i : i + 2]
+            matches.append(
+                {
+                    "deck_id_1": first.get_last_deck().id,
+                    "player_id_1": first.id,
+                    "player_score_1": 10,
+                    "deck_id_2": second.get_last_deck().id,
+                    "player_id_2": second.id,
+                    "player_score_2": 10,
+                }
+            )
+        return matches
+
+    def test_one_room(self):
+        matches = self.matches(1)
+        # rooms, seats, states, decks, heroes and a savepoint around them
+        with self.assertNumQueries(7):
+            slug = sync_create_rooms(matches)[0]
+        self.assertEqual(HeroInGame.objects.filter(room__slug=slug).count(), 32)
+
+    def test_batch(self):
+        # the same queries for any number of rooms, as long as their heroes
+        # fit into one insert of the database
+        matches = self.matches(3)
+        with self.assertNumQueries(7):
+            slugs = sync_create_rooms(matches)
+        self.assertEqual(len(set(slugs)), 3)
+        self.assertEqual(PlayerInRoom.objects.filter(room__slug__in=slugs).count(), 6)
+
+
+class RoomJoinTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.slug = create_room()
+
+    def setUp(self):
+        room_snapshots.pop(self.slug)
+
+    def join(self):
+        snapshot = get_room_snapshot(self.slug)
+        return snapshot, get_seat_states(snapshot)
+
+    def test_first_join(self):
+        # room with its players, then their states
+        with self.assertNumQueries(2):
+            snapshot, states = self.join()
+        self.assertEqual(len(snapshot.seats), 2)
+        self.assertEqual(set(states.values()), {SeatState("Game started", 0)})
+
+    def test_reconnect(self):
+        self.join()
+        with self.assertNumQueries(1):
+            snapshot, states = self.join()
+        self.assertEqual(set(states), {x.id for x in snapshot.seats})
+
+    def test_unknown_room(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_room_snapshot("unknown"))
+
+
+@override_settings(**MEMORY_BACKENDS)
+class RoomTestCase(TestCase):
+    """room with two players, served by in-memory backends"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.slug = create_room()
+
+    def setUp(self):
+        self.snapshot = get_room_snapshot(self.slug)
+        self.first = next(x for x in self.snapshot.seats if x.first)
+        self.second = next(x for x in self.snapshot.seats if not x.first)
+        clear_backends()
+
+    async def join(self):
+        return await join_actor(self.snapshot.room, self.first.id)
+
+
+class RoomActorTest(RoomTestCase):
+    async def test_moves_in_turn(self):
+        actor = await self.join()
+
+        second_move = find_move(actor.board, self.second.id)
+        self.assertIsNone(await actor.submit_move(self.second, *second_move))
+
+        version, changes = await actor.submit_move(
+            self.first, *find_move(actor.board, self.first.id)
+        )
+        self.assertEqual(version, 1)
+        self.assertIsNone(changes[0][2])
+
+        self.assertIsNone(
+            await actor.submit_move(self.first, *find_move(actor.board, self.first.id))
+        )
+        version, _ = await actor.submit_move(self.second, *second_move)
+        self.assertEqual(version, 2)
+        await actor.leave()
+
+    async def test_concurrent_moves_ordered(self):
+        actor = await self.join()
+        move = find_move(actor.board, self.first.id)
+
+        results = await asyncio.gather(
+            actor.submit_move(self.first, *move),
+            actor.submit_move(self.first, *move),
+        )
+        self.assertEqual(results[0][0], 1)
+        self.assertIsNone(results[1])
+        await actor.leave()
+
+    async def test_cancelled_move_keeps_actor(self):
+        actor = await self.join()
+        move = find_move(actor.board, self.first.id)
+
+        submitted = asyncio.create_task(actor.submit_move(self.first, *move))
+        await asyncio.sleep(0)
+        submitted.cancel()
+        await asyncio.sleep(0.01)
+
+        # first move was made, actor goes on with the next one
+        self.assertEqual(actor.round, 1)
+        move = find_move(actor.board, self.second.id)
+        version, _ = await asyncio.wait_for(actor.submit_move(self.second, *move), 1)
+        self.assertEqual(version, 2)
+        await actor.leave()
+
+    async def test_room_owned_by_another_process(self):
+        journal = get_move_journal()
+        await journal.acquire(self.snapshot.room.id, "other", 30)
+        with self.assertRaises(RoomOwnedElsewhere):
+            await self.join()
+
+        await journal.release(self.snapshot.room.id, "other")
+        actor = await self.join()
+        await actor.leave()
+
+
+class MoveWriterTest(RoomTestCase):
+    async def make_move(self, actor):
+        return await actor.submit_move(
+            self.first, *find_move(actor.board, self.first.id)
+        )
+
+    async def test_flush(self):
+        actor = await self.join()
+        _, changes = await self.make_move(actor)
+        await actor.writer.flush()
+
+        room = self.snapshot.room
+        self.assertEqual(await count(room.moves.all()), 1)
+        self.assertEqual(await get_move_journal().pending(room.id), [])
+        x, y, (type, health) = changes[1]
+        self.assertEqual(await count(room.heroes.filter(x=x, y=y, dead=False)), 1)
+        await actor.leave()
+
+    async def test_recovery(self):
+        actor = await self.join()
+        move = find_move(actor.board, self.first.id)
+        await actor.submit_move(self.first, *move)
+        # process is gone before moves were saved, journal is kept
+        actor.writer._task.cancel()
+        del _actors[self.snapshot.room.id]
+        get_move_journal().owners.clear()
+
+        actor = await self.join()
+        self.assertEqual(actor.round, 1)
+        self.assertIsNone(actor.board.get(move[0], move[1]))
+        await actor.leave()
+        self.assertEqual(await count(self.snapshot.room.moves.all()), 1)
+
+    async def test_journal_failure_keeps_board(self):
+        actor = await self.join()
+        board = actor.board.to_list()
+
+        with mock.patch.object(
+            get_move_journal(), "append", side_effect=ConnectionError
+        ), self.assertLogs("room.services.room_actor", "ERROR"):
+            with self.assertRaises(ConnectionError):
+                await self.make_move(actor)
+        self.assertEqual(actor.round, 0)
+        self.assertEqual(actor.board.to_list(), board)
+        await actor.leave()
+
+    async def test_lease_taken_over(self):
+        actor = await self.join()
+        await self.make_move(actor)
+        room = self.snapshot.room
+        # lease expired while process was stuck, another one took the room
+        get_move_journal().owners[room.id] = ("other", time.time() + 30)
+
+        with self.assertLogs("room.services.write_behind", "ERROR"):
+            await actor.writer._save_pending()
+        self.assertTrue(actor.writer.lost)
+        # moves are left to the new owner
+        self.assertEqual(len(await get_move_journal().pending(room.id)), 1)
+        self.assertEqual(await count(room.moves.all()), 0)
+
+        move = find_move(actor.board, self.second.id)
+        with self.assertRaises(RoomOwnedElsewhere):
+            await actor.submit_move(self.second, *move)
+        self.assertEqual(actor.round, 1)
+        with self.assertRaises(RoomOwnedElsewhere):
+            await self.join()
+        await actor.leave()
+        self.assertEqual(len(await get_move_journal().pending(room.id)), 1)
+
+    async def test_saved_moves_skipped(self):
+        actor = await self.join()
+        await self.make_move(actor)
+        moves = list(actor.writer.pending)
+
+        await actor.writer._save(moves)
+        await actor.writer._save(moves)
+        self.assertEqual(await count(self.snapshot.room.moves.all()), 1)
+        await actor.leave()
+
+
+class HeaderAuthMiddlewareTest(SimpleTestCase):
+    async def authenticate(self, token: str | None) -> int | bool:
+        scopes = []
+
+        async def app(scope, receive, send):
+            scopes.append(scope)
+
+        headers = [(b"authorization", token.encode())] if token is not None else []
+        await HeaderAuthMiddleware(app)({"headers": headers}, None, None)
+        return scopes[0]["player"]
+
+    async def test_token_read_on_event_loop(self):
+        threads = []
+
+        def read(token):
+            threads.append(threading.get_ident())
+            return read_jwt(token)
+
+        token = sign_jwt({"id": 7, "type": "access"}, t_life=60)
+        with mock.patch("room.middleware.read_jwt", side_effect=read):
+            self.assertEqual(await self.authenticate(token), 7)
+        self.assertEqual(threads, [threading.get_ident()])
+
+    async def test_bad_tokens(self):
+        tokens = [
+            None,
+            "",
+            "malformed",
+            pyjwt.encode({"id": 7, "type": "access"}, "other", algorithm="HS256"),
+            sign_jwt({"type": "access"}, t_life=60),
+        ]
+        for token in tokens:
+            with self.subTest(token=token):
+                self.assertIs(await self.authenticate(token), False)
+
+
+class PresenceTests:
+    """cases for presence backends, backend is set by subclasses"""
+
+    backend: BasePresenceBackend
+
+    async def test_online(self):
+        self.assertEqual(await self.backend.touch(1, 10, "a"), {10: "a"})
+        self.assertEqual(await self.backend.touch(1, 20, "b"), {10: "a", 20: "b"})
+        self.assertEqual(await self.backend.online(2), {})
+
+    async def test_late_leave_keeps_new_channel(self):
+        await self.backend.touch(1, 10, "old")
+        await self.backend.touch(1, 10, "new")
+        # old socket closes after player is back
+        await self.backend.leave(1, 10, "old")
+        self.assertEqual(await self.backend.online(1), {10: "new"})
+
+        await self.backend.leave(1, 10, "new")
+        self.assertEqual(await self.backend.online(1), {})
+
+    async def test_expired(self):
+        await self.backend.touch(1, 10, "a")
+        later = time.time() + self.backend.ttl + 1
+        with mock.patch("room.services.presence.time.time", return_value=later):
+            self.assertEqual(await self.backend.online(1), {})
+
+
+class MemoryPresenceTest(PresenceTests, SimpleTestCase):
+    def setUp(self):
+        self.backend = MemoryPresenceBackend()
+
+
+class RedisPresenceTest(PresenceTests, SimpleTestCase):
+    def setUp(self):
+        self.backend = RedisPresenceBackend()
+        self.backend.client = fakeredis.aioredis.FakeRedis(
+            server=fakeredis.FakeServer()
+        )
+        self.backend._leave = self.backend.client.register_script(
+            self.backend.LEAVE_SCRIPT
+        )
+
+
+class BoardTest(SimpleTestCase):
+    def setUp(self):
+        self.board = Board()
+
+    def place(self, type: str, x: int, y: int, first: bool = True) -> Piece:
+        piece = Piece(x * 10 + y, type, 1 if first else 2, first, 5)
+        self.board.place(piece, x, y)
+        return piece
+
+    def assertMoves(self, x: int, y: int, expected: set):
+        moves = {
+            (t_x, t_y)
+            for t_x, t_y in SQUARES
+            if self.board.validate_move(x, y, t_x, t_y)
+        }
+        self.assertEqual(moves, expected)
+
+    def test_king(self):
+        self.place("KING", 1, 1)
+        self.assertMoves(1, 1, {(2, 1), (1, 2), (2, 2)})
+
+    def test_wizard(self):
+        self.place("WIZARD", 4, 4)
+        self.assertTrue(self.board.validate_move(4, 4, 4, 8))
+        self.assertTrue(self.board.validate_move(4, 4, 1, 4))
+        self.assertTrue(self.board.validate_move(4, 4, 8, 8))
+        self.assertFalse(self.board.validate_move(4, 4, 5, 6))
+
+    def test_archer(self):
+        self.place("ARCHER", 4, 4)
+        self.assertTrue(self.board.validate_move(4, 4, 1, 1))
+        self.assertTrue(self.board.validate_move(4, 4, 7, 1))
+        self.assertFalse(self.board.validate_move(4, 4, 4, 6))
+
+    def test_warrior_goes_forward(self):
+        # both sides may step diagonally, only towards the opponent
+        self.place("WARRIOR", 4, 2)
+        self.assertMoves(4, 2, {(3, 3), (4, 3), (5, 3)})
+        self.place("WARRIOR", 4, 7, first=False)
+        self.assertMoves(4, 7, {(3, 6), (4, 6), (5, 6)})
+
+    def test_target_must_be_empty(self):
+        self.place("KING", 1, 1)
+        self.place("WARRIOR", 2, 2, first=False)
+        self.assertFalse(self.board.validate_move(1, 1, 2, 2))
+
+    def test_blocked_path(self):
+        self.place("WIZARD", 1, 1)
+        self.place("ARCHER", 3, 3)
+        self.place("WARRIOR", 1, 4)
+        self.assertFalse(self.board.validate_move(1, 1, 5, 5))
+        self.assertFalse(self.board.validate_move(1, 1, 1, 6))
+        self.assertTrue(self.board.validate_move(1, 1, 2, 2))
+        self.assertTrue(self.board.validate_move(1, 1, 1, 3))
+
+    def test_path_excludes_start(self):
+        self.place("WIZARD", 1, 1)
+        # the moving piece itself doesn't block its path
+        self.assertTrue(self.board.path_is_clear(1, 1, 1, 8))
+        self.place("WARRIOR", 1, 8)
+        self.assertTrue(self.board.path_is_clear(1, 1, 1, 8))
+        self.place("WARRIOR", 1, 2)
+        self.assertFalse(self.board.path_is_clear(1, 1, 1, 8))
+
+    def test_off_board(self):
+        self.place("KING", 1, 1)
+        self.assertFalse(self.board.validate_move(1, 1, 0, 1))
+        self.assertFalse(self.board.validate_move(1, 1, 1, 0))
+        self.assertFalse(self.board.validate_move(0, 0, 1, 1))
+        self.assertFalse(self.board.validate_move(1, 1, 9, 9))
+
+    def test_empty_square_and_no_move(self):
+        self.place("KING", 1, 1)
+        self.assertFalse(self.board.validate_move(2, 2, 3, 3))
+        self.assertFalse(self.board.validate_move(1, 1, 1, 1))
+
+
+class CodecTest(SimpleTestCase):
+    board = [[None] * 8 for _ in range(8)]
+    board[0][4] = ["KING", 7]
+    board[7][3] = ["WIZARD", 2]
+    messages = [
+        {"type": "BOARD", "version": 3, "board": board},
+        {
+            "type": "BOARD_DIFF",
+            "version": 4,
+            "changes": [[1, 2, None], [2, 3, ["WARRIOR", 10]]],
+        },
+        {"type": "move", "px": 1, "py": 2, "x": 2, "y": 3},
+        {"type": "INFO", "message": "user found", "room": "abc"},
+    ]
+
+    def test_round_trip(self):
+        for codec in CODECS.values():
+            for message in self.messages:
+                with self.subTest(codec=codec.name, type=message["type"]):
+                    frame = codec.encode(message)
+                    self.assertIsInstance(frame, bytes if codec.binary else str)
+                    self.assertEqual(codec.decode(frame), message)
+
+    def test_packed_layouts(self):
+        codec = CODECS["packed"]
+        frames = [codec.encode(x) for x in self.messages]
+        self.assertEqual(frames[0][0], codec.BOARD)
+        # only occupied squares are sent
+        self.assertEqual(len(frames[0]), codec.board_struct.size + 2 * 4)
+        self.assertEqual(frames[1][0], codec.BOARD_DIFF)
+        self.assertEqual(len(frames[2]), codec.move_struct.size)
+        self.assertEqual(frames[3][0], codec.OTHER)
+
+    def test_bad_frames(self):
+        codec = CODECS["packed"]
+        diff = codec.encode(self.messages[1])
+        bad = [
+            diff[:-1],
+            codec.encode(self.messages[2])[:-1],
+            bytes([codec.BOARD]),
+            diff[: codec.board_struct.size] + bytes([9, 1, 0, 0, 1, 1, 0, 0]),
+            diff[: codec.board_struct.size] + bytes([1, 1, 5, 1, 1, 1, 0, 0]),
+            bytes([9]) + diff[1:],
+            b"",
+            "text",
+        ]
+        for frame in bad:
+            with self.subTest(frame=frame), self.assertRaises(ValueError):
+                codec.decode(frame)
+
+        for codec, frame in [(CODECS["json"], "{"), (CODECS["msgpack"], b"\xc1")]:
+            with self.subTest(codec=codec.name), self.assertRaises(ValueError):
+                codec.decode(frame)
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate_codec(["unknown", "packed"]).name, "packed")
+        self.assertEqual(negotiate_codec([]).name, "json")
+
+
+class BoardTraceTest(SimpleTestCase):
+    def setUp(self):
+        self.board = Board()
+        self.board.place(Piece(1, "KING", 1, True, 5), 5, 1)
+
+    @override_settings(ROOM_BOARD_TRACE=True)
+    def test_trace_logged(self):
+        with self.assertLogs("room.services.game_logic", "DEBUG") as logs:
+            make_move(self.board, 5, 1, 5, 2)
+        self.assertIn("from 5 1 to 5 2", logs.output[0])
+
+    def test_no_trace(self):
+        with self.assertNoLogs("room.services.game_logic", "DEBUG"):
+            make_move(self.board, 5, 1, 5, 2)
+
+
+class MoveEncodingTest(SimpleTestCase):
+    def test_round_trip(self):
+        for px, py in SQUARES:
+            for x, y in SQUARES:
+                move = encode_move(px, py, x, y)
+                self.assertLess(move, 1 << 12)
+                self.assertEqual(decode_move(move), (px, py, x, y))
+
+
+class ReplayTest(RoomTestCase):
+    async def test_replay_board(self):
+        actor = await self.join()
+        boards = []
+        for seat in [self.first, self.second, self.first]:
+            move = find_move(actor.board, seat.id)
+            await actor.submit_move(seat, *move)
+            boards.append(actor.board.to_list())
+        await actor.writer.flush()
+
+        room = self.snapshot.room
+        moves = await sync_to_async(get_moves)(room, 1)
+        self.assertEqual([x[0] for x in moves], [2, 3])
+        for seq, board in enumerate(boards, start=1):
+            replayed = await sync_to_async(replay_board)(room, until=seq)
+            self.assertEqual(replayed.to_list(), board)
+        replayed = await sync_to_async(replay_board)(room)
+        self.assertEqual(replayed.to_list(), actor.board.to_list())
+        await actor.leave()
+
+
+@override_settings(**MEMORY_BACKENDS)
+class RoomConsumerTest(TransactionTestCase):
+    """websocket connections to room, consumers reach db from other threads"""
+
+    def setUp(self):
+        self.slug = create_room()
+        seats = get_room_snapshot(self.slug).seats
+        self.first, self.second = [
+            Player.objects.get(id=seat.player_id)
+            for seat in sorted(seats, key=lambda x: not x.first)
+        ]
+        self.group = f"room_{self.slug}"
+        clear_backends()
+
+    async def connect(self, player, query: str = "") -> WebsocketCommunicator:
+        client = WebsocketCommunicator(
+            application,
+            f"/room/{self.slug}{query}",
+            headers=[(b"authorization", player.get_access_token().encode())],
+        )
+        connected, _ = await client.connect()
+        self.assertTrue(connected)
+        return client
+
+    async def test_diffs_ordered_by_version(self):
+        client = await self.connect(self.first)
+        await client.receive_json_from()
+        board = await client.receive_json_from()
+        layer = get_channel_layer()
+
+        # diff that came before previous one is answered with full board
+        await layer.group_send(
+            self.group,
+            {"type": "board_diff", "version": 2, "changes": [], "exclude": None},
+        )
+        message = await client.receive_json_from()
+        self.assertEqual(message["type"], "BOARD")
+
+        # diff client already has is skipped
+        await layer.group_send(
+            self.group,
+            {"type": "board_diff", "version": 0, "changes": [], "exclude": None},
+        )
+        self.assertTrue(await client.receive_nothing(0.1))
+
+        # other events have nothing to be recovered from and aren't dropped
+        for message in ["second", "first"]:
+            await layer.group_send(
+                self.group, {"type": "info", "message": message, "exclude": None}
+            )
+        messages = [await client.receive_json_from() for _ in range(2)]
+        self.assertEqual([x["message"] for x in messages], ["second", "first"])
+        await client.disconnect()
+
+    async def test_move_sent_to_room(self):
+        first = await self.connect(self.first)
+        board = (await first.receive_json_from(), await first.receive_json_from())[1]
+        second = await self.connect(self.second)
+        await second.receive_json_from()
+        await second.receive_json_from()
+
+        # second row of first player is full, its first hero can go forward
+        x = 2 if board["board"][1][0][0] == "ARCHER" else 1
+        await first.send_json_to({"type": "move", "px": 1, "py": 2, "x": x, "y": 3})
+
+        for client in [first, second]:
+            while (message := await client.receive_json_from())["type"] == "INFO":
+                pass
+            self.assertEqual(message["type"], "BOARD_DIFF")
+            self.assertEqual(message["version"], 1)
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_session_resumed(self):
+        first = await self.connect(self.first)
+        session = (await first.receive_json_from())["session"]
+        board = (await first.receive_json_from())["board"]
+        x = 2 if board[1][0][0] == "ARCHER" else 1
+        await first.send_json_to({"type": "move", "px": 1, "py": 2, "x": x, "y": 3})
+        await first.receive_json_from()
+
+        # second player moves while first one is away
+        second = await self.connect(self.second)
+        await second.receive_json_from()
+        await second.receive_json_from()
+        await first.disconnect()
+        x = 2 if board[6][0][0] == "ARCHER" else 1
+        await second.send_json_to({"type": "move", "px": 1, "py": 7, "x": x, "y": 6})
+        while (await second.receive_json_from())["type"] != "BOARD_DIFF":
+            pass
+
+        with mock.patch.object(RoomConsumer, "connect_to_room") as connect_to_room:
+            first = await self.connect(self.first, f"?session={session}")
+            info = await first.receive_json_from()
+            moves = await first.receive_json_from()
+        connect_to_room.assert_not_called()
+        self.assertEqual(info["session"], session)
+        self.assertEqual(moves["type"], "MOVES")
+        self.assertEqual([x[0] for x in moves["moves"]], [2])
+
+        # unknown token is ignored, room is loaded again
+        await first.disconnect()
+        first = await self.connect(self.first, "?session=wrong")
+        self.assertNotEqual((await first.receive_json_from())["session"], session)
+        self.assertEqual((await first.receive_json_from())["type"], "BOARD")
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_room_taken_over(self):
+        client = await self.connect(self.first)
+        board = (await client.receive_json_from(), await client.receive_json_from())[1]
+        room = await sync_to_async(Room.objects.get)(slug=self.slug)
+        actor = _actors[room.id].result()
+        get_move_journal().owners[room.id] = ("other", time.time() + 30)
+        with self.assertLogs("room.services.write_behind", "ERROR"):
+            await actor.writer._save_pending()
+
+        x = 2 if board["board"][1][0][0] == "ARCHER" else 1
+        await client.send_json_to({"type": "move", "px": 1, "py": 2, "x": x, "y": 3})
+        message = await client.receive_json_from()
+        self.assertEqual(message["message"], "room is served by another worker")
+        self.assertEqual((await client.receive_output())["type"], "websocket.close")
+        await client.disconnect()
+
+    async def watch(self) -> WebsocketCommunicator:
+        client = WebsocketCommunicator(application, f"/room/{self.slug}/watch")
+        connected, _ = await client.connect()
+        self.assertTrue(connected)
+        return client
+
+    async def test_spectator_gets_diffs(self):
+        spectator = await self.watch()
+        board = await spectator.receive_json_from()
+        self.assertEqual(board["type"], "BOARD")
+
+        player = await self.connect(self.first)
+        await player.receive_json_from()
+        await player.receive_json_from()
+        x = 2 if board["board"][1][0][0] == "ARCHER" else 1
+        await player.send_json_to({"type": "move", "px": 1, "py": 2, "x": x, "y": 3})
+
+        message = await spectator.receive_json_from()
+        self.assertEqual(message["type"], "BOARD_DIFF")
+        self.assertEqual(message["version"], 1)
+        self.assertEqual(message["changes"][0], [1, 2, None])
+
+        await spectator.send_json_to({"type": "move", "px": 1, "py": 3, "x": 1, "y": 4})
+        self.assertEqual((await spectator.receive_json_from())["type"], "ERROR")
+        await spectator.disconnect()
+        await player.disconnect()
+
+    @override_settings(ROOM_SPECTATOR_BUFFER=2)
+    async def test_spectator_without_acks_dropped(self):
+        spectator = await self.watch()
+        await spectator.receive_json_from()
+        layer = get_channel_layer()
+
+        received = []
+        for version in range(1, 5):
+            await layer.group_send(
+                self.group,
+                {
+                    "type": "board_diff",
+                    "version": version,
+                    "changes": [],
+                    "exclude": None,
+                },
+            )
+            output = await spectator.receive_output()
+            if output["type"] == "websocket.close":
+                break
+            received.append(json.loads(output["text"])["version"])
+            if version == 1:
+                await spectator.send_json_to({"type": "ack", "version": 1})
+                await spectator.receive_nothing(0.05)
+
+        # acked version lets spectator get two more, the next one closes it
+        self.assertEqual(received, [1, 2, 3])
+        self.assertEqual(output, {"type": "websocket.close", "code": 1013})
+        await spectator.disconnect()